@@ -0,0 +1,124 @@
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web_application"))
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+import thumbnails
+
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        _Handler.requests.append(self.path)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(Image is None, "Pillow is not installed")
+class ThumbnailCacheTest(unittest.TestCase):
+    """Runs the cache against a local http.server so no network is needed."""
+
+    def setUp(self):
+        self.images_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        for i in range(3):
+            pixels = rng.integers(0, 256, size=(400, 400, 3), dtype=np.uint8)
+            Image.fromarray(pixels).save(os.path.join(self.images_dir.name, f"{i}.png"))
+        _Handler.requests = []
+        handler = functools.partial(_Handler, directory=self.images_dir.name)
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.images_dir.cleanup()
+        self.cache_dir.cleanup()
+
+    def make_cache(self, **kwargs):
+        cache = thumbnails.ThumbnailCache(self.cache_dir.name, **kwargs)
+        self.addCleanup(cache._executor.shutdown)
+        return cache
+
+    def test_get_fetches_once_and_serves_from_disk(self):
+        cache = self.make_cache()
+        url = f"{self.base}/0.png"
+        path = cache.get(url)
+        self.assertTrue(os.path.exists(path))
+        with Image.open(path) as image:
+            self.assertLessEqual(max(image.size), 300)
+        self.assertEqual(cache.get(url), path)
+        self.assertEqual(_Handler.requests, ["/0.png"])
+        self.assertEqual(cache.static_url(url), f"{thumbnails.THUMBNAIL_URL}/{os.path.basename(path)}")
+        self.assertTrue(cache.data_uri(url).startswith("data:image/jpeg;base64,"))
+
+    def test_cached_static_url_never_fetches(self):
+        cache = self.make_cache()
+        url = f"{self.base}/0.png"
+        self.assertIsNone(cache.cached_static_url(url))
+        self.assertEqual(cache._pending, {})
+        self.assertEqual(_Handler.requests, [])
+        path = cache.get(url)
+        self.assertEqual(cache.cached_static_url(url), f"{thumbnails.THUMBNAIL_URL}/{os.path.basename(path)}")
+
+    def test_evicts_least_recently_used(self):
+        sizes = []
+        for i in range(3):
+            with open(os.path.join(self.images_dir.name, f"{i}.png"), "rb") as f:
+                sizes.append(len(thumbnails.make_thumbnail(f.read())))
+        cache = self.make_cache(max_bytes=sum(sizes) - 1)
+        first = cache.get(f"{self.base}/0.png")
+        second = cache.get(f"{self.base}/1.png")
+        cache.cached_path(f"{self.base}/0.png")  # ไฟล์ที่สองจึงเป็นไฟล์ที่ไม่ได้ใช้นานที่สุด
+        third = cache.get(f"{self.base}/2.png")
+
+        self.assertFalse(os.path.exists(second))
+        self.assertTrue(os.path.exists(first))
+        self.assertTrue(os.path.exists(third))
+        self.assertEqual(cache._total_bytes, sizes[0] + sizes[2])
+        self.assertIsNone(cache.cached_path(f"{self.base}/1.png"))
+
+    def test_index_survives_restart(self):
+        cache = self.make_cache(save_interval=60)
+        path = cache.get(f"{self.base}/0.png")
+        cache.flush()
+        restarted = self.make_cache()
+        self.assertEqual(restarted.cached_path(f"{self.base}/0.png"), path)
+        self.assertEqual(restarted._total_bytes, os.path.getsize(path))
+
+    def test_failed_url_is_retried_after_ttl(self):
+        cache = self.make_cache(failure_ttl=0.2)
+        url = f"{self.base}/missing.png"
+        for future in cache.prefetch([url]):
+            self.assertIsNone(future.result())
+        self.assertEqual(cache.prefetch([url]), [])
+
+        time.sleep(0.3)
+        with open(os.path.join(self.images_dir.name, "0.png"), "rb") as f:
+            data = f.read()
+        with open(os.path.join(self.images_dir.name, "missing.png"), "wb") as f:
+            f.write(data)
+        futures = cache.prefetch([url])
+        self.assertEqual(len(futures), 1)
+        self.assertTrue(os.path.exists(futures[0].result()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,8 @@
 import streamlit as st
+import startup
+
+# เริ่มโหลดข้อมูลและโมเดลใน background โดยไม่บล็อกหน้าแรก
+startup.start(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
 
 st.set_page_config(
     page_title="Restaurant Recommender System",
@@ -12,3 +16,15 @@ st.markdown("""
             You can rate restaurants and get recommendations based on your ratings.            
             """)
 
+# ร้านยอดนิยมจากการโหลดครั้งล่าสุด แสดงได้ทันทีระหว่างรอข้อมูล
+popular = startup.popular_restaurants()
+if popular:
+    st.subheader("Popular Restaurants")
+    for i, restaurant in enumerate(popular[:10]):
+        st.markdown(f"{i+1}. **{restaurant['title']}** · 🍽️ {restaurant['categoryname']} · ⭐ {restaurant['totalscore']:.1f}")
+
+if startup.is_ready():
+    with st.sidebar.expander("Startup timings"):
+        st.json({label: round(seconds, 3) for label, seconds in startup.timings.items()})
+else:
+    st.sidebar.info("Loading restaurant data and model in the background...")
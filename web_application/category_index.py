@@ -0,0 +1,33 @@
+import numpy as np
+
+
+class CategoryIndex:
+    """Restaurants grouped by ``categoryname``, built once per data snapshot.
+
+    Titles within each category are sorted and unique, and ``placeids`` holds
+    the place id of the first catalog row for each of those titles.
+    """
+
+    def __init__(self, data):
+        frame = data[['categoryname', 'title', 'placeid']].dropna(subset=['categoryname', 'title'])
+        frame = frame[frame['categoryname'].astype(str).str.strip() != '']
+        frame = frame.drop_duplicates(subset=['categoryname', 'title']).sort_values(
+            ['categoryname', 'title'], kind='stable'
+        )
+        self.titles = {}
+        self.placeids = {}
+        for category, group in frame.groupby('categoryname', sort=True):
+            self.titles[category] = group['title'].to_numpy()
+            self.placeids[category] = group['placeid'].to_numpy()
+        self.categories = list(self.titles)
+        self.counts = {category: len(titles) for category, titles in self.titles.items()}
+        self.all_titles = np.sort(data['title'].dropna().unique())
+
+    def titles_for(self, categories):
+        """Sorted, unique titles across ``categories``."""
+        arrays = [self.titles[category] for category in categories if category in self.titles]
+        if not arrays:
+            return np.empty(0, dtype=object)
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.unique(np.concatenate(arrays))
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+AMENITY_FEATURES = [
+    'delivery', 'dining_in', 'group_friendly',
+    'kid_friendly', 'free_parking',
+    'beer', 'alcohol', 'desserts',
+    'wheelchair_accessible', 'free_wifi',
+    'credit_cards', 'halal_food', 'vegetarian_options',
+    'live_performances', 'live_music', 'dog_friendly'
+]
+
+# น้ำหนักของแต่ละกลุ่ม feature ก่อน normalize
+CATEGORICAL_WEIGHTS = {'categoryname': 1.0, 'price': 0.5, 'city': 0.5}
+AMENITY_WEIGHT = 0.25
+
+
+def build_feature_matrix(frame):
+    """Sparse, L2-normalised feature rows for each restaurant in ``frame``."""
+    n_rows = len(frame)
+    blocks = []
+    for column, weight in CATEGORICAL_WEIGHTS.items():
+        if column not in frame.columns:
+            continue
+        codes, uniques = pd.factorize(frame[column])
+        present = np.flatnonzero(codes >= 0)
+        blocks.append(sparse.csr_matrix(
+            (np.full(len(present), weight, dtype=np.float32), (present, codes[present])),
+            shape=(n_rows, len(uniques))
+        ))
+    amenities = [feature for feature in AMENITY_FEATURES if feature in frame.columns]
+    if amenities:
+        flags = frame[amenities].eq(True).to_numpy()
+        blocks.append(sparse.csr_matrix(flags.astype(np.float32) * AMENITY_WEIGHT))
+    features = sparse.hstack(blocks, format='csr', dtype=np.float32)
+    norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(features).tocsr().astype(np.float32)
+
+
+def top_k_neighbours(features, k=20, chunk_size=512):
+    """Top-``k`` cosine neighbours of every row as a sparse (n x n) matrix."""
+    n_rows = features.shape[0]
+    k = min(k, max(n_rows - 1, 0))
+    rows, cols, values = [], [], []
+    if k == 0:
+        return sparse.csr_matrix((n_rows, n_rows), dtype=np.float32)
+    features_t = features.T.tocsc()
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        sims = features[start:stop].dot(features_t).toarray()
+        sims[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        keep = top_sims > 0
+        rows.append(np.repeat(np.arange(start, stop), k)[keep.ravel()])
+        cols.append(top[keep])
+        values.append(top_sims[keep])
+    return sparse.csr_matrix(
+        (np.concatenate(values).astype(np.float32), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_rows, n_rows)
+    )
+
+
+class ContentSimilarity:
+    """Item-item similarity from categories, price, city and amenity flags."""
+
+    def __init__(self, placeids, neighbours, rating_scale=(1, 5)):
+        self.placeids = np.asarray(placeids)
+        self.index = {placeid: row for row, placeid in enumerate(self.placeids)}
+        self.neighbours = neighbours
+        self.rating_scale = rating_scale
+
+    @classmethod
+    def from_frame(cls, data, k=20, rating_scale=(1, 5)):
+        unique = data.drop_duplicates(subset=['placeid']).reset_index(drop=True)
+        features = build_feature_matrix(unique)
+        return cls(unique['placeid'].to_numpy(), top_k_neighbours(features, k), rating_scale)
+
+    def similar(self, placeid, n=10):
+        row = self.index.get(placeid)
+        if row is None:
+            return []
+        start, stop = self.neighbours.indptr[row], self.neighbours.indptr[row + 1]
+        cols = self.neighbours.indices[start:stop]
+        sims = self.neighbours.data[start:stop]
+        order = np.argsort(-sims, kind='stable')[:n]
+        return [(self.placeids[cols[i]], float(sims[i])) for i in order]
+
+    def _scores(self, ratings):
+        low, high = self.rating_scale
+        mid, half = (low + high) / 2, (high - low) / 2
+        rated = [(self.index[p], (r - mid) / half) for p, r in ratings.items() if p in self.index]
+        if not rated:
+            return np.zeros(len(self.placeids), dtype=np.float32), np.zeros(len(self.placeids), dtype=bool)
+        rows = np.array([row for row, _ in rated])
+        weights = np.array([w for _, w in rated], dtype=np.float32)
+        block = self.neighbours[rows]
+        numerator = block.T.dot(weights)
+        denominator = abs(block).T.dot(np.abs(weights))
+        supported = denominator > 0
+        return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=supported), supported
+
+    def scores(self, ratings):
+        """Content score in [-1, 1] for every item given ``{placeid: rating}``.
+
+        Ratings above the middle of the scale pull neighbours up, ratings below
+        push them down; items that are not a neighbour of anything rated get 0.
+        """
+        return self._scores(ratings)[0]
+
+    def support(self, ratings):
+        """Boolean mask of the items that are a neighbour of something rated."""
+        return self._scores(ratings)[1]
+
+    def estimate(self, ratings, placeids, fallback=None):
+        """Content scores for ``placeids`` mapped onto the rating scale.
+
+        Items without content evidence get ``fallback`` (an array aligned with
+        ``placeids``, e.g. the SVD estimates) or the middle of the scale.
+        """
+        low, high = self.rating_scale
+        mid, half = (low + high) / 2, (high - low) / 2
+        scores, supported = self._scores(ratings)
+        rows = np.array([self.index.get(p, -1) for p in placeids], dtype=np.int64)
+        safe_rows = np.maximum(rows, 0)
+        has_support = (rows >= 0) & supported[safe_rows]
+        if fallback is None:
+            fallback = np.full(len(rows), mid)
+        return np.where(has_support, mid + half * scores[safe_rows], np.asarray(fallback, dtype=np.float64))
+
+
+def blend(svd_estimates, content_estimates, content_weight):
+    """Hybrid ranking score: a convex mix of SVD and content estimates."""
+    return (1 - content_weight) * np.asarray(svd_estimates) + content_weight * np.asarray(content_estimates)
@@ -0,0 +1,344 @@
+"""Offline comparison of recommendation engines on held-out users.
+
+Test users are removed from the training ratings and replayed as new users:
+each engine sees part of their ratings and is scored on the rest, the same
+way the pages treat a visitor who has just rated a few restaurants.
+
+    python evaluate_recommenders.py --reviews reviews.csv --restaurants restaurants.csv --model dump_SVD_file.pkl \\
+        --engines refit,foldin,content,popularity --test-users 500 --workers 8 --output report.md
+
+Without ``--reviews``/``--restaurants`` the tables are read from Supabase using
+the ``SUPABASE_URL`` and ``SUPABASE_KEY`` environment variables. The ``refit``
+and ``foldin`` engines use the hyperparameters of the served model, read from
+``--model`` or downloaded from Supabase the same way.
+"""
+import argparse
+import json
+import math
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from surprise import SVD, Dataset, Reader
+
+from content_similarity import ContentSimilarity
+from online_svd import ModelVersion
+
+RATING_SCALE = (1, 5)
+SVD_PARAMS = ('n_factors', 'n_epochs', 'biased', 'init_mean', 'init_std_dev', 'lr_bu', 'lr_bi',
+              'lr_pu', 'lr_qi', 'reg_bu', 'reg_bi', 'reg_pu', 'reg_qi')
+NEW_USER = 'new_user'
+
+
+class RefitEngine:
+    """What the pages do today: refit SVD on all ratings plus the new user."""
+
+    def __init__(self, context):
+        self.train = context['train']
+        self.items = context['items']
+        self.params = context['svd_params']
+
+    def score(self, visible):
+        new_user = pd.DataFrame(
+            [(NEW_USER, placeid, float(rating)) for placeid, rating in visible.items()],
+            columns=['reviewerid', 'placeid', 'reviewerrated']
+        )
+        combined = pd.concat([self.train, new_user]).reset_index(drop=True)
+        trainset = Dataset.load_from_df(combined, Reader(rating_scale=RATING_SCALE)).build_full_trainset()
+        algo = SVD(**self.params)
+        algo.fit(trainset)
+        return np.array([algo.predict(NEW_USER, placeid).est for placeid in self.items])
+
+
+class FoldInEngine:
+    """A few SGD steps on the new user's row of the pre-trained model."""
+
+    def __init__(self, context):
+        self.version = context['base_version']
+        self.items = context['items']
+        self.n_steps = context['fold_in_steps']
+        self.rng = np.random.default_rng(context['seed'])
+
+    def score(self, visible):
+        ratings = [(NEW_USER, placeid, rating) for placeid, rating in visible.items()]
+        version = self.version.updated(ratings, n_steps=self.n_steps, rng=self.rng)
+        return version.predict_many(NEW_USER, self.items)
+
+
+class ContentEngine:
+    def __init__(self, context):
+        self.engine = context['content']
+        self.items = context['items']
+
+    def score(self, visible):
+        return self.engine.estimate(visible, self.items)
+
+
+class PopularityEngine:
+    """Same Bayesian-average ranking for everyone; a floor for the others."""
+
+    def __init__(self, context, prior_weight=10):
+        train = context['train']
+        stats = train.groupby('placeid')['reviewerrated'].agg(['sum', 'count'])
+        global_mean = train['reviewerrated'].mean()
+        stats = stats.reindex(context['items']).fillna(0)
+        self.scores = ((stats['sum'] + global_mean * prior_weight) / (stats['count'] + prior_weight)).to_numpy()
+
+    def score(self, visible):
+        return self.scores
+
+
+ENGINES = {
+    'refit': RefitEngine,
+    'foldin': FoldInEngine,
+    'content': ContentEngine,
+    'popularity': PopularityEngine,
+}
+
+
+def split_users(ratings, n_test_users, min_ratings, holdout, seed):
+    """Pick test users and split each one's ratings into visible / held out."""
+    rng = np.random.default_rng(seed)
+    counts = ratings.groupby('reviewerid').size()
+    eligible = counts[counts >= min_ratings].index.to_numpy()
+    test_users = rng.choice(eligible, size=min(n_test_users, len(eligible)), replace=False)
+    is_test = ratings['reviewerid'].isin(test_users)
+    cases = []
+    for _, group in ratings[is_test].groupby('reviewerid'):
+        group = group.drop_duplicates(subset=['placeid'], keep='last')
+        order = rng.permutation(len(group))
+        n_hidden = max(1, int(round(len(group) * holdout)))
+        hidden, shown = group.iloc[order[:n_hidden]], group.iloc[order[n_hidden:]]
+        if len(shown) == 0:
+            continue
+        cases.append((
+            dict(zip(shown['placeid'], shown['reviewerrated'].astype(float))),
+            dict(zip(hidden['placeid'], hidden['reviewerrated'].astype(float))),
+        ))
+    return ratings[~is_test].reset_index(drop=True), cases
+
+
+def ranking_metrics(ranked, hidden, k, threshold):
+    relevant = {placeid for placeid, rating in hidden.items() if rating >= threshold}
+    top = ranked[:k]
+    gains = [1.0 if placeid in relevant else 0.0 for placeid in top]
+    hits = sum(gains)
+    dcg = sum(gain / math.log2(rank + 2) for rank, gain in enumerate(gains))
+    ideal = sum(1.0 / math.log2(rank + 2) for rank in range(min(len(relevant), k)))
+    return {
+        'precision': hits / k,
+        'recall': hits / len(relevant) if relevant else None,
+        'ndcg': dcg / ideal if ideal > 0 else None,
+    }
+
+
+_context = None
+_engines = None
+
+
+def _init_worker(context, engine_names):
+    global _context, _engines
+    _context = context
+    _engines = {name: ENGINES[name](context) for name in engine_names}
+
+
+def _peak_memory(engine, visible):
+    # วัดแยกจากรอบที่จับเวลา เพราะ tracemalloc ทำให้ทุก allocation ช้าลง
+    tracemalloc.start()
+    try:
+        engine.score(visible)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _evaluate_shard(cases, k, threshold, measure_memory):
+    """Score every case; ``measure_memory[i]`` replays case ``i`` untimed under tracemalloc."""
+    items = _context['items']
+    position = _context['position']
+    results = {name: [] for name in _engines}
+    for (visible, hidden), measure in zip(cases, measure_memory):
+        hidden = {placeid: rating for placeid, rating in hidden.items() if placeid in position}
+        for name, engine in _engines.items():
+            started = time.perf_counter()
+            scores = np.asarray(engine.score(visible), dtype=np.float64)
+            latency = time.perf_counter() - started
+            peak = _peak_memory(engine, visible) if measure else None
+
+            hidden_pos = [position[p] for p in hidden]
+            hidden_true = [hidden[p] for p in hidden]
+            squared_errors = ((scores[hidden_pos] - np.array(hidden_true)) ** 2).tolist()
+
+            candidates = scores.copy()
+            candidates[[position[p] for p in visible if p in position]] = -np.inf
+            top = np.argsort(-candidates, kind='stable')[:k]
+            ranked = [items[i] for i in top]
+
+            record = ranking_metrics(ranked, hidden, k, threshold)
+            record.update({
+                'squared_errors': squared_errors,
+                'recommended': ranked,
+                'latency': latency,
+                'peak_bytes': peak,
+            })
+            results[name].append(record)
+    return results
+
+
+def summarise(records, n_items):
+    def mean_of(key):
+        values = [r[key] for r in records if r[key] is not None]
+        return float(np.mean(values)) if values else float('nan')
+
+    squared_errors = [e for r in records for e in r['squared_errors']]
+    latencies = np.array([r['latency'] for r in records]) * 1000
+    peaks = [r['peak_bytes'] for r in records if r['peak_bytes'] is not None]
+    recommended = {placeid for r in records for placeid in r['recommended']}
+    return {
+        'users': len(records),
+        'rmse': float(np.sqrt(np.mean(squared_errors))) if squared_errors else float('nan'),
+        'precision': mean_of('precision'),
+        'recall': mean_of('recall'),
+        'ndcg': mean_of('ndcg'),
+        'coverage': len(recommended) / n_items if n_items else float('nan'),
+        'latency_mean_ms': float(latencies.mean()) if len(latencies) else float('nan'),
+        'latency_p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else float('nan'),
+        'peak_mb': float(np.mean(peaks)) / 2 ** 20 if peaks else float('nan'),
+    }
+
+
+def format_report(summary, k, baseline):
+    columns = [
+        ('RMSE', 'rmse', '{:.4f}'), (f'P@{k}', 'precision', '{:.4f}'), (f'R@{k}', 'recall', '{:.4f}'),
+        (f'NDCG@{k}', 'ndcg', '{:.4f}'), ('Coverage', 'coverage', '{:.3f}'),
+        ('Mean ms', 'latency_mean_ms', '{:.1f}'), ('p95 ms', 'latency_p95_ms', '{:.1f}'),
+        ('Peak MB', 'peak_mb', '{:.1f}'),
+    ]
+    lines = [
+        '| Engine | Users | ' + ' | '.join(title for title, _, _ in columns) + ' |',
+        '|---|---|' + '---|' * len(columns),
+    ]
+    for name, stats in summary.items():
+        cells = [fmt.format(stats[key]) for _, key, fmt in columns]
+        lines.append(f"| {name} | {stats['users']} | " + ' | '.join(cells) + ' |')
+
+    if baseline in summary and len(summary) > 1:
+        base = summary[baseline]
+        lines += ['', f'Change relative to `{baseline}`:', '',
+                  '| Engine | ΔRMSE | ΔNDCG@{k} | Speed-up |'.format(k=k), '|---|---|---|---|']
+        for name, stats in summary.items():
+            if name == baseline:
+                continue
+            speed_up = base['latency_mean_ms'] / stats['latency_mean_ms'] if stats['latency_mean_ms'] else float('inf')
+            lines.append(
+                f"| {name} | {stats['rmse'] - base['rmse']:+.4f} | "
+                f"{stats['ndcg'] - base['ndcg']:+.4f} | {speed_up:.1f}x |"
+            )
+    return '\n'.join(lines) + '\n'
+
+
+def load_tables(args):
+    if args.reviews and args.restaurants:
+        ratings = pd.read_csv(args.reviews)[['reviewerid', 'placeid', 'reviewerrated']]
+        return pd.read_csv(args.restaurants), ratings
+    from supabase import create_client
+    from startup import load_data_from_db
+
+    return load_data_from_db(create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY']))
+
+
+def load_served_params(args):
+    """Hyperparameters of the served model, so both SVD engines match what the pages refit."""
+    if args.model:
+        from surprise import dump
+
+        _, algo = dump.load(args.model)
+    else:
+        from supabase import create_client
+        from startup import load_model_from_db
+
+        _, algo = load_model_from_db(create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY']))
+    return {name: getattr(algo, name) for name in SVD_PARAMS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', help='CSV export of the reviews table')
+    parser.add_argument('--restaurants', help='CSV export of the restaurants table')
+    parser.add_argument('--model', help='pickled served model (dump_SVD_file.pkl) to take SVD hyperparameters from')
+    parser.add_argument('--engines', default='refit,foldin,content,popularity')
+    parser.add_argument('--baseline', default='refit')
+    parser.add_argument('--test-users', type=int, default=200)
+    parser.add_argument('--min-ratings', type=int, default=5)
+    parser.add_argument('--holdout', type=float, default=0.2)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=4.0, help='lowest rating counted as relevant')
+    parser.add_argument('--fold-in-steps', type=int, help="defaults to the served model's n_epochs, as on the pages")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shard-size', type=int, default=20)
+    parser.add_argument('--memory-sample', type=int, default=20,
+                        help='users whose peak memory is measured in a separate untimed pass (0 to skip)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the Markdown report here')
+    parser.add_argument('--json', help='write the summary numbers here')
+    args = parser.parse_args()
+
+    engine_names = [name.strip() for name in args.engines.split(',') if name.strip()]
+    unknown = [name for name in engine_names if name not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)} (choose from {', '.join(ENGINES)})")
+
+    restaurants, ratings = load_tables(args)
+    train, cases = split_users(ratings, args.test_users, args.min_ratings, args.holdout, args.seed)
+    items = restaurants['placeid'].drop_duplicates().tolist()
+    print(f"{len(cases)} test users, {len(train)} training ratings, {len(items)} restaurants")
+
+    svd_params = {'random_state': args.seed}
+    if 'refit' in engine_names or 'foldin' in engine_names:
+        svd_params.update(load_served_params(args))
+    context = {
+        'train': train,
+        'items': items,
+        'position': {placeid: i for i, placeid in enumerate(items)},
+        'svd_params': svd_params,
+        'fold_in_steps': args.fold_in_steps or svd_params.get('n_epochs', 20),
+        'seed': args.seed,
+    }
+    if 'foldin' in engine_names:
+        base = SVD(**svd_params)
+        base.fit(Dataset.load_from_df(train, Reader(rating_scale=RATING_SCALE)).build_full_trainset())
+        context['base_version'] = ModelVersion.from_algo(base)
+    if 'content' in engine_names:
+        context['content'] = ContentSimilarity.from_frame(restaurants, rating_scale=RATING_SCALE)
+
+    memory_step = math.ceil(len(cases) / args.memory_sample) if args.memory_sample > 0 else 0
+    measure_memory = [memory_step > 0 and i % memory_step == 0 for i in range(len(cases))]
+    shards = [(cases[i:i + args.shard_size], measure_memory[i:i + args.shard_size])
+              for i in range(0, len(cases), args.shard_size)]
+    records = {name: [] for name in engine_names}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(context, engine_names)) as executor:
+        futures = [executor.submit(_evaluate_shard, shard, args.k, args.threshold, measured)
+                   for shard, measured in shards]
+        for done, future in enumerate(futures, start=1):
+            for name, shard_records in future.result().items():
+                records[name].extend(shard_records)
+            print(f"shard {done}/{len(shards)} done ({time.perf_counter() - started:.0f}s)")
+
+    summary = {name: summarise(records[name], len(items)) for name in engine_names}
+    report = format_report(summary, args.k, args.baseline)
+    print(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
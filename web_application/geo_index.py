@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lng, lats, lngs):
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = (np.sin((lats - lat) / 2) ** 2
+         + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoGridIndex:
+    """Bucket index of restaurant coordinates on a fixed lat/lng grid.
+
+    Row numbers returned by the queries are positions in the frame the index
+    was built from, so they can be combined with any boolean filter mask over
+    the same frame.
+    """
+
+    def __init__(self, lats, lngs, cell_deg=0.01):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.cell_deg = cell_deg
+        valid = np.flatnonzero(np.isfinite(self.lats) & np.isfinite(self.lngs))
+        cells = {}
+        keys_lat = np.floor(self.lats[valid] / cell_deg).astype(np.int64)
+        keys_lng = np.floor(self.lngs[valid] / cell_deg).astype(np.int64)
+        for row, key in zip(valid, zip(keys_lat.tolist(), keys_lng.tolist())):
+            cells.setdefault(key, []).append(row)
+        self.cells = {key: np.array(rows, dtype=np.int32) for key, rows in cells.items()}
+
+    @classmethod
+    def from_frame(cls, data, cell_deg=0.01):
+        return cls(data['lat'].to_numpy(dtype=float), data['lng'].to_numpy(dtype=float), cell_deg)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def _lng_span(self, lat, radius_km):
+        # ระยะทางต่อองศาของลองจิจูดลดลงตาม cos(lat)
+        km_per_deg = math.pi * EARTH_RADIUS_KM / 180
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + radius_km / km_per_deg, 89.9))), 1e-6)
+        return radius_km / (km_per_deg * cos_lat)
+
+    def _candidates(self, lat, lng, lat_cells, lng_cells):
+        c_lat, c_lng = self._cell(lat, lng)
+        found = []
+        if (2 * lat_cells + 1) * (2 * lng_cells + 1) > len(self.cells):
+            # หน้าต่างใหญ่กว่าจำนวน bucket ที่มีจริง วนตาม bucket แทน
+            for (k_lat, k_lng), rows in self.cells.items():
+                if abs(k_lat - c_lat) <= lat_cells and abs(k_lng - c_lng) <= lng_cells:
+                    found.append(rows)
+        else:
+            for d_lat in range(-lat_cells, lat_cells + 1):
+                for d_lng in range(-lng_cells, lng_cells + 1):
+                    rows = self.cells.get((c_lat + d_lat, c_lng + d_lng))
+                    if rows is not None:
+                        found.append(rows)
+        if not found:
+            return np.empty(0, dtype=np.int32)
+        return np.concatenate(found)
+
+    def within_radius(self, lat, lng, radius_km, mask=None):
+        """Rows within ``radius_km`` of (lat, lng), nearest first, with distances."""
+        km_per_deg = math.pi * EARTH_RADIUS_KM / 180
+        lat_cells = int(math.ceil(radius_km / km_per_deg / self.cell_deg))
+        lng_cells = int(math.ceil(self._lng_span(lat, radius_km) / self.cell_deg))
+        rows = self._candidates(lat, lng, lat_cells, lng_cells)
+        if mask is not None:
+            rows = rows[np.asarray(mask)[rows]]
+        dist = haversine_km(lat, lng, self.lats[rows], self.lngs[rows])
+        keep = dist <= radius_km
+        rows, dist = rows[keep], dist[keep]
+        order = np.argsort(dist, kind='stable')
+        return rows[order], dist[order]
+
+    def nearest(self, lat, lng, k, mask=None):
+        """The ``k`` nearest rows to (lat, lng), optionally restricted by ``mask``."""
+        km_per_deg = math.pi * EARTH_RADIUS_KM / 180
+        ring = 0
+        max_ring = int(math.ceil(360 / self.cell_deg))
+        rows = np.empty(0, dtype=np.int32)
+        while True:
+            rows = self._candidates(lat, lng, ring, ring)
+            if mask is not None:
+                rows = rows[np.asarray(mask)[rows]]
+            if len(rows) >= k or ring >= max_ring:
+                break
+            ring = min(max(1, ring * 2), max_ring)
+        if len(rows) == 0:
+            return rows, np.empty(0)
+        # ring ที่ครอบคลุมแล้วรับประกันเฉพาะระยะทางถึงขอบ ring ดังนั้นขยายต่อให้ครบรัศมีของอันดับที่ k
+        dist = haversine_km(lat, lng, self.lats[rows], self.lngs[rows])
+        kth = np.partition(dist, min(k, len(dist)) - 1)[min(k, len(dist)) - 1]
+        covered_km = ring * self.cell_deg * km_per_deg * max(math.cos(math.radians(abs(lat) + ring * self.cell_deg)), 0)
+        if ring < max_ring and kth > covered_km:
+            rows, dist = self.within_radius(lat, lng, kth, mask=mask)
+        order = np.argsort(dist, kind='stable')[:k]
+        return rows[order], dist[order]
+
+    def radius_mask(self, lat, lng, radius_km):
+        mask = np.zeros(len(self), dtype=bool)
+        rows, _ = self.within_radius(lat, lng, radius_km)
+        mask[rows] = True
+        return mask
@@ -0,0 +1,261 @@
+import threading
+
+import numpy as np
+
+
+class RowTable:
+    """Read-only base array plus a dict of rows that were replaced or appended.
+
+    Updating a row never touches the base array, so a new version only costs a
+    copy of the (small) overlay dict plus the rows that actually changed.
+    """
+
+    def __init__(self, base, overlay=None, size=None):
+        self.base = base
+        self.overlay = overlay if overlay is not None else {}
+        self.size = size if size is not None else len(base)
+
+    def __len__(self):
+        return self.size
+
+    def get(self, row):
+        value = self.overlay.get(row)
+        if value is None:
+            return self.base[row]
+        return value
+
+    def with_rows(self, rows, size=None):
+        overlay = dict(self.overlay)
+        overlay.update(rows)
+        return RowTable(self.base, overlay, size if size is not None else self.size)
+
+    def compact(self):
+        # รวม overlay กลับเข้า base เป็น array ใหม่ (ทำเป็นครั้งคราวเท่านั้น)
+        base = np.empty((self.size,) + self.base.shape[1:], dtype=self.base.dtype)
+        base[:len(self.base)] = self.base
+        for row, value in self.overlay.items():
+            base[row] = value
+        base.setflags(write=False)
+        return RowTable(base)
+
+
+class ModelVersion:
+    """Immutable snapshot of SVD factors that can be predicted from concurrently."""
+
+    def __init__(self, version, params, user_index, item_index, pu, qi, bu, bi,
+                 new_users=None, new_items=None):
+        self.version = version
+        self.params = params
+        self.user_index = user_index
+        self.item_index = item_index
+        self.new_users = new_users if new_users is not None else {}
+        self.new_items = new_items if new_items is not None else {}
+        self.pu = pu
+        self.qi = qi
+        self.bu = bu
+        self.bi = bi
+
+    @classmethod
+    def from_algo(cls, algo):
+        trainset = algo.trainset
+        params = {
+            'n_factors': algo.n_factors,
+            'biased': algo.biased,
+            'init_mean': algo.init_mean,
+            'init_std_dev': algo.init_std_dev,
+            'lr_bu': algo.lr_bu,
+            'lr_bi': algo.lr_bi,
+            'lr_pu': algo.lr_pu,
+            'lr_qi': algo.lr_qi,
+            'reg_bu': algo.reg_bu,
+            'reg_bi': algo.reg_bi,
+            'reg_pu': algo.reg_pu,
+            'reg_qi': algo.reg_qi,
+            'global_mean': trainset.global_mean if algo.biased else 0.0,
+            'rating_scale': trainset.rating_scale,
+        }
+        arrays = []
+        for array in (algo.pu, algo.qi, algo.bu, algo.bi):
+            array = np.array(array, dtype=np.float64)
+            array.setflags(write=False)
+            arrays.append(RowTable(array))
+        return cls(0, params, dict(trainset._raw2inner_id_users),
+                   dict(trainset._raw2inner_id_items), *arrays)
+
+    def user_row(self, uid):
+        row = self.user_index.get(uid)
+        return row if row is not None else self.new_users.get(uid)
+
+    def item_row(self, iid):
+        row = self.item_index.get(iid)
+        return row if row is not None else self.new_items.get(iid)
+
+    def estimate(self, uid, iid):
+        u = self.user_row(uid)
+        i = self.item_row(iid)
+        params = self.params
+        if params['biased']:
+            est = params['global_mean']
+            if u is not None:
+                est += self.bu.get(u)
+            if i is not None:
+                est += self.bi.get(i)
+        else:
+            est = params['global_mean']
+        if u is not None and i is not None:
+            est += float(np.dot(self.pu.get(u), self.qi.get(i)))
+        return est
+
+    def predict(self, uid, iid):
+        low, high = self.params['rating_scale']
+        return min(high, max(low, self.estimate(uid, iid)))
+
+    def _gather(self, table, rows, width=None):
+        known = rows >= 0
+        shape = (len(rows),) if width is None else (len(rows), width)
+        values = np.zeros(shape)
+        in_base = known & (rows < len(table.base))
+        values[in_base] = table.base[rows[in_base]]
+        if table.overlay:
+            # วนเฉพาะตำแหน่งที่อยู่ใน overlay แทนการวนทั้ง catalog
+            keys = np.fromiter(table.overlay.keys(), dtype=np.int64, count=len(table.overlay))
+            hits = np.flatnonzero(np.isin(rows, keys))
+            if len(hits):
+                values[hits] = [table.overlay[row] for row in rows[hits].tolist()]
+        return values
+
+    def predict_many(self, uid, iids):
+        """Clipped predictions of ``uid`` for every item in ``iids`` at once."""
+        rows = np.fromiter((-1 if row is None else row for row in map(self.item_row, iids)), dtype=np.int64)
+        params = self.params
+        est = np.full(len(rows), params['global_mean'], dtype=np.float64)
+        u = self.user_row(uid)
+        if params['biased']:
+            est += self._gather(self.bi, rows)
+            if u is not None:
+                est += self.bu.get(u)
+        if u is not None:
+            qi = self._gather(self.qi, rows, params['n_factors'])
+            est += np.where(rows >= 0, qi.dot(self.pu.get(u)), 0.0)
+        low, high = params['rating_scale']
+        return np.clip(est, low, high)
+
+    def updated(self, ratings, n_steps=3, rng=None):
+        """Return a new version with a few SGD steps applied for ``ratings``.
+
+        ``ratings`` is an iterable of ``(uid, iid, rating)`` tuples. Only the
+        rows of the users and items that appear in it are copied and changed.
+        """
+        ratings = list(ratings)
+        params = self.params
+        rng = rng if rng is not None else np.random.default_rng()
+        new_users = dict(self.new_users)
+        new_items = dict(self.new_items)
+        n_users = len(self.pu)
+        n_items = len(self.qi)
+
+        pu_rows, qi_rows, bu_rows, bi_rows = {}, {}, {}, {}
+        coords = []
+        for uid, iid, rating in ratings:
+            u = self.user_row(uid)
+            if u is None:
+                u = new_users.get(uid)
+            if u is None:
+                u = n_users
+                n_users += 1
+                new_users[uid] = u
+                pu_rows[u] = rng.normal(params['init_mean'], params['init_std_dev'], params['n_factors'])
+                bu_rows[u] = 0.0
+            i = self.item_row(iid)
+            if i is None:
+                i = new_items.get(iid)
+            if i is None:
+                i = n_items
+                n_items += 1
+                new_items[iid] = i
+                qi_rows[i] = rng.normal(params['init_mean'], params['init_std_dev'], params['n_factors'])
+                bi_rows[i] = 0.0
+            # copy-on-write: คัดลอกเฉพาะแถวที่ถูกแก้ไข
+            if u not in pu_rows:
+                pu_rows[u] = np.array(self.pu.get(u), dtype=np.float64)
+                bu_rows[u] = float(self.bu.get(u))
+            if i not in qi_rows:
+                qi_rows[i] = np.array(self.qi.get(i), dtype=np.float64)
+                bi_rows[i] = float(self.bi.get(i))
+            coords.append((u, i, float(rating)))
+
+        global_mean = params['global_mean']
+        for _ in range(n_steps):
+            for u, i, rating in coords:
+                pu_u = pu_rows[u]
+                qi_i = qi_rows[i]
+                err = rating - (global_mean + bu_rows[u] + bi_rows[i] + float(np.dot(pu_u, qi_i)))
+                if params['biased']:
+                    bu_rows[u] += params['lr_bu'] * (err - params['reg_bu'] * bu_rows[u])
+                    bi_rows[i] += params['lr_bi'] * (err - params['reg_bi'] * bi_rows[i])
+                pu_rows[u] = pu_u + params['lr_pu'] * (err * qi_i - params['reg_pu'] * pu_u)
+                qi_rows[i] = qi_i + params['lr_qi'] * (err * pu_u - params['reg_qi'] * qi_i)
+
+        for rows in (pu_rows, qi_rows):
+            for value in rows.values():
+                value.setflags(write=False)
+
+        return ModelVersion(
+            self.version + 1, params, self.user_index, self.item_index,
+            self.pu.with_rows(pu_rows, n_users), self.qi.with_rows(qi_rows, n_items),
+            self.bu.with_rows(bu_rows, n_users), self.bi.with_rows(bi_rows, n_items),
+            new_users, new_items,
+        )
+
+    def overlay_size(self):
+        return max(len(self.pu.overlay), len(self.qi.overlay))
+
+    def compacted(self):
+        user_index = dict(self.user_index)
+        user_index.update(self.new_users)
+        item_index = dict(self.item_index)
+        item_index.update(self.new_items)
+        return ModelVersion(
+            self.version, self.params, user_index, item_index,
+            self.pu.compact(), self.qi.compact(), self.bu.compact(), self.bi.compact(),
+        )
+
+
+class OnlineSVD:
+    """Keeps a served SVD model fresh by applying SGD steps to new ratings.
+
+    Readers always see a complete :class:`ModelVersion` through ``current``;
+    writers build the next version off to the side and publish it with a single
+    reference swap.
+    """
+
+    def __init__(self, algo, n_steps=3, compact_ratio=0.25, random_state=None):
+        self._current = ModelVersion.from_algo(algo)
+        self.n_steps = n_steps
+        self.compact_ratio = compact_ratio
+        self._rng = np.random.default_rng(random_state)
+        self._write_lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._current
+
+    def partial_fit(self, ratings):
+        with self._write_lock:
+            version = self._current.updated(ratings, n_steps=self.n_steps, rng=self._rng)
+            # รวม overlay เมื่อโตเกินสัดส่วนที่กำหนด เพื่อให้ค่าใช้จ่ายเฉลี่ยยังคงต่ำ
+            if version.overlay_size() > self.compact_ratio * max(len(version.pu.base), len(version.qi.base)):
+                version = version.compacted()
+            self._current = version
+            return version
+
+    def fold_in(self, ratings):
+        """Version with ``ratings`` applied that is *not* published to readers.
+
+        For anonymous visitors: their ratings shape only their own
+        predictions. Use :meth:`partial_fit` for ingested reviews.
+        """
+        return self._current.updated(ratings, n_steps=self.n_steps)
+
+    def predict(self, uid, iid):
+        return self._current.predict(uid, iid)
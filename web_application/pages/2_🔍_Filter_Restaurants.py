@@ -1,12 +1,17 @@
 import streamlit as st
-import pandas as pd
-from supabase import create_client, Client
+import startup
 
-# ดึง API key จากไฟล์ secret.toml
-supabase_url = st.secrets["SUPABASE_URL"]
-supabase_key = st.secrets["SUPABASE_KEY"]
+# import โมดูลที่ใช้เวลานานเมื่อถูกใช้งานจริงเท่านั้น
+pd = startup.lazy_import("pandas")
+np = startup.lazy_import("numpy")
+streamlit_folium = startup.lazy_import("streamlit_folium")
+geo_index_module = startup.lazy_import("geo_index")
+result_map = startup.lazy_import("result_map")
+session_handles = startup.lazy_import("session_handles")
+thumbnails = startup.lazy_import("thumbnails")
 
-supabase: Client = create_client(supabase_url, supabase_key)
+# ดึง API key จากไฟล์ secret.toml แล้วเริ่มโหลดข้อมูลและโมเดลใน background
+startup.start(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
 
 # Page setup
 st.set_page_config(
@@ -17,21 +22,21 @@ st.set_page_config(
 st.title("🔍 Filter Restaurants")
 st.sidebar.success("Select your preferred filters")
 
-@st.cache_data
-def load_data_from_db():
-    response_restaurants = (supabase.table("restaurants").select("*").execute())    
-    data = pd.DataFrame(response_restaurants.data)
-    response_ratings = (supabase.table("reviews").select("*").execute())
-    ratings_data = pd.DataFrame(response_ratings.data)
-    ratings_data = ratings_data[['reviewerid', 'placeid', 'reviewerrated']]
-    return data, ratings_data
+# _data ไม่ถูก hash ทุก rerun (startup คืน DataFrame ตัวเดิมตลอดอายุ process)
+@st.cache_resource
+def load_geo_index(_data):
+    return geo_index_module.GeoGridIndex.from_frame(_data)
 
 # Load data
-data, ratings_data = load_data_from_db()
+with st.spinner("Loading restaurant data..."):
+    data, ratings_data = startup.get_data()
+geo_index = load_geo_index(data)
 
 # Initialize session state for filters if not exists
-if 'filtered_data' not in st.session_state:
-    st.session_state.filtered_data = data
+# เก็บเฉพาะตำแหน่งแถวของผลลัพธ์ (None = ทุกแถว) แทนการเก็บ DataFrame ทั้งก้อน
+if 'filtered_rows' not in st.session_state:
+    st.session_state.filtered_rows = None
+    st.session_state.filtered_distances = None
 
 if 'apply_filters' not in st.session_state:
     st.session_state.apply_filters = False
@@ -51,6 +56,17 @@ with filter_tabs[1]:
     cities = sorted(data['city'].dropna().unique())
     selected_cities = st.multiselect("Select Cities:", cities)
 
+    # ค้นหาร้านที่อยู่ใกล้ตำแหน่งที่กำหนด
+    use_nearby = st.checkbox("Only show restaurants near a location")
+    if use_nearby:
+        lat_col, lng_col, radius_col = st.columns(3)
+        with lat_col:
+            near_lat = st.number_input("Latitude:", value=float(data['lat'].mean()), format="%.6f")
+        with lng_col:
+            near_lng = st.number_input("Longitude:", value=float(data['lng'].mean()), format="%.6f")
+        with radius_col:
+            near_radius = st.slider("Radius (km):", min_value=0.5, max_value=50.0, value=5.0, step=0.5)
+
 with filter_tabs[2]:
     st.subheader("Price & Rating")
     
@@ -117,22 +133,22 @@ with filter_tabs[3]:
 # Apply filters button
 if st.button("Apply Filters"):
     st.session_state.apply_filters = True
-    filtered = data.copy()
+    mask = np.ones(len(data), dtype=bool)
     
     # Apply category filter
     if selected_categories:
-        filtered = filtered[filtered['categoryname'].isin(selected_categories)]
+        mask &= data['categoryname'].isin(selected_categories).to_numpy()
     
     # Apply city filter
     if selected_cities:
-        filtered = filtered[filtered['city'].isin(selected_cities)]
+        mask &= data['city'].isin(selected_cities).to_numpy()
     
     # Apply price filter
     if selected_prices:
-        filtered = filtered[filtered['price'].isin(selected_prices)]
+        mask &= data['price'].isin(selected_prices).to_numpy()
     
     # Apply rating filter
-    filtered = filtered[(filtered['totalscore'] >= min_rating) & (filtered['totalscore'] <= max_rating)]
+    mask &= ((data['totalscore'] >= min_rating) & (data['totalscore'] <= max_rating)).to_numpy()
     
     # Apply additional features filters
     for feature, selected in selected_features.items():
@@ -140,21 +156,35 @@ if st.button("Apply Filters"):
             # Check if additionalInfo contains the feature with value True
             # The additionalInfo is stored as a string representation of a dictionary
             # ตรวจสอบว่าคอลัมน์มีอยู่ในข้อมูลก่อน
-            if feature in filtered.columns:
-                filtered = filtered[filtered[feature] == True]
-    
-    # Update filtered data in session state
-    st.session_state.filtered_data = filtered        
+            if feature in data.columns:
+                mask &= (data[feature] == True).to_numpy()
+    
+    # Apply distance filter and rank by distance
+    # Update filtered rows in session state
+    if use_nearby:
+        near_rows, near_dist = geo_index.within_radius(near_lat, near_lng, near_radius, mask=mask)
+        st.session_state.filtered_rows = near_rows.astype(np.int32)
+        st.session_state.filtered_distances = near_dist.astype(np.float32)
+    else:
+        st.session_state.filtered_rows = session_handles.rows_from_mask(mask)
+        st.session_state.filtered_distances = None
 
 if st.button("Reset Filters"):
-    st.session_state.filtered_data = data
+    st.session_state.filtered_rows = None
+    st.session_state.filtered_distances = None
     st.session_state.apply_filters = False
     st.success("Filters have been reset.")
 
 # Display results
 if st.session_state.apply_filters:
+    # สร้างตารางผลลัพธ์จากตำแหน่งแถวเฉพาะตอนแสดงผล
+    filtered_view = session_handles.take_rows(data, st.session_state.filtered_rows)
+    if st.session_state.filtered_distances is not None:
+        filtered_view = filtered_view.assign(distance_km=st.session_state.filtered_distances)
+    place_rows = session_handles.unique_place_rows(data, st.session_state.filtered_rows)
+
     # Count restaurants after filtering
-    count = len(st.session_state.filtered_data['placeid'].unique())
+    count = len(place_rows)
     
     st.subheader(f"Filtered Results: {count} Restaurants")
     
@@ -162,17 +192,32 @@ if st.session_state.apply_filters:
         st.warning("No restaurants match your selected filters. Please try different criteria.")
     else:
         # Show sample of filtered restaurants
+        display_columns = ['title', 'categoryname', 'city', 'price', 'totalscore']
+        if 'distance_km' in filtered_view.columns:
+            display_columns.append('distance_km')
         st.dataframe(
-            st.session_state.filtered_data[['title', 'categoryname', 'city', 'price', 'totalscore']].drop_duplicates().reset_index(drop=True),
+            filtered_view[display_columns].drop_duplicates().reset_index(drop=True),
             use_container_width=True
         )
+
+        # แสดงร้านทั้งหมดบนแผนที่เดียวแบบ cluster
+        # ใช้เฉพาะ thumbnail ที่มีในเครื่องแล้ว ไม่สั่งดึงรูปของทุกร้านที่ผ่านตัวกรอง
+        streamlit_folium.st_folium(
+            result_map.build_cluster_map(
+                filtered_view,
+                image_url=thumbnails.default_cache().cached_static_url,
+                remote_fallback=False
+            ),
+            use_container_width=True,
+            returned_objects=[],
+            key="filtered_results_map"
+        )
         
         # Save filtered results for use in recommendation page
         #if st.button("Use These Filters for Recommendations"):
-            # Store unique place IDs of filtered restaurants
-        filtered_ids = st.session_state.filtered_data['placeid'].unique().tolist()
+            # Store one row per filtered restaurant
         # Save to session state for use in the recommendation page
-        st.session_state.filtered_restaurant_ids = filtered_ids
+        st.session_state.filtered_restaurant_rows = place_rows
         st.success(f"Filter applied! {count} restaurants will be used for recommendations on the Projects page.")
 else:
     st.info("Use the filters above to narrow down restaurant options, then click 'Apply Filters'.")
@@ -1,18 +1,19 @@
 import streamlit as st
-import pandas as pd
-import folium
-from surprise import SVD, dump, Dataset, Reader
 from collections import defaultdict
-from streamlit_folium import st_folium
-import time
-from supabase import create_client, Client
+import startup
 
+# import โมดูลที่ใช้เวลานานเมื่อถูกใช้งานจริงเท่านั้น
+pd = startup.lazy_import("pandas")
+folium = startup.lazy_import("folium")
+surprise = startup.lazy_import("surprise")
+streamlit_folium = startup.lazy_import("streamlit_folium")
+result_map = startup.lazy_import("result_map")
+content_similarity = startup.lazy_import("content_similarity")
+session_handles = startup.lazy_import("session_handles")
+thumbnails = startup.lazy_import("thumbnails")
 
-# ดึง API key จากไฟล์ secret.toml
-supabase_url = st.secrets["SUPABASE_URL"]
-supabase_key = st.secrets["SUPABASE_KEY"]
-
-supabase: Client = create_client(supabase_url, supabase_key)
+# ดึง API key จากไฟล์ secret.toml แล้วเริ่มโหลดข้อมูลและโมเดลใน background
+startup.start(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
 
 # Page setup
 st.set_page_config(
@@ -22,31 +23,23 @@ st.set_page_config(
 st.title("🍽️ Restaurant Recommender System")
 st.sidebar.success("Welcome to Restaurant Recommender System")
 
-@st.cache_data
-def load_data_from_db():
-    response_restaurants = (supabase.table("restaurants").select("*").execute())    
-    data = pd.DataFrame(response_restaurants.data)
-    response_ratings = (supabase.table("reviews").select("*").execute())
-    ratings_data = pd.DataFrame(response_ratings.data)
-    ratings_data = ratings_data[['reviewerid', 'placeid', 'reviewerrated']]
-    return data, ratings_data
+# ขั้นเลือกและให้คะแนนใช้แค่ข้อมูลร้าน ส่วนโมเดลจะรอเมื่อถึงขั้นแนะนำเท่านั้น
+with st.spinner("Loading restaurant data..."):
+    data, ratings_data = startup.get_data()
 
+# _data ไม่ถูก hash ทุก rerun (startup คืน DataFrame ตัวเดิมตลอดอายุ process)
 @st.cache_resource
-def load_model_from_db():
-    bucket_name = "dumpmodel"
-    destination_path = ".\dump_model\dump_SVD_file.pkl"
-    with open(destination_path, "wb") as f:
-        response = (
-            supabase.storage
-            .from_(bucket_name)
-            .download("dump_model/dump_SVD_file.pkl")
-        )
-        f.write(response)
-    predictions, algo = dump.load(destination_path)
-    return predictions, algo
+def load_content_engine(_data):
+    return content_similarity.ContentSimilarity.from_frame(_data)
+
+content_engine = load_content_engine(data)
 
-data, ratings_data = load_data_from_db()
-predictions, algo = load_model_from_db()
+# thumbnail ของรูปร้านเก็บไว้ในเครื่อง แล้วค่อยๆ ดึงล่วงหน้าสำหรับร้านที่กำลังจะแสดง
+thumbnail_cache = thumbnails.default_cache()
+
+def prefetch_thumbnails(frame):
+    if 'imageurls' in frame.columns:
+        thumbnail_cache.prefetch(result_map.first_image_url(value) for value in frame['imageurls'])
 
 # Random restaurant selection (only one at a time)
 def get_random_restaurant():
@@ -66,33 +59,7 @@ def create_folium_map(restaurant):
 def get_user_rating(restaurant_name, mode='rating', idx=None):
     restaurant = data[data['title'] == restaurant_name].iloc[0]
     
-    # ดึง URL รูปภาพแรก (ถ้ามี)
-    image_url = None
-    if 'imageurls' in restaurant and pd.notna(restaurant['imageurls']):
-        if isinstance(restaurant['imageurls'], str):
-            try:
-                image_list = eval(restaurant['imageurls'])
-            except:
-                image_list = []
-        else:
-            image_list = restaurant['imageurls']
-        
-        if len(image_list) > 0:
-            image_url = image_list[0]
-
-    # สร้าง HTML สำหรับ Popup
-    popup_content = f"""
-    <div style="max-width: 300px; word-wrap: break-word;">
-        <h4 style="margin-bottom: 5px; font-size: 16px; text-align: left;">{restaurant['title']}</h4>
-        <p><a href='{restaurant['url']}' target='_blank'>View on Google Map</a></p>
-    """
-    if image_url:
-        popup_content += f"<img src='{image_url}' style='width:300px;'>"
-    else:
-        popup_content += "<p>No image available</p>"       
-    
-
-    with st.container(border=True, height=700):
+    with st.container(border=True):
         # แสดงข้อมูลร้านอาหารในคอลัมน์เดียว
         st.markdown(f"""
         <div class="restaurant-card">
@@ -104,18 +71,18 @@ def get_user_rating(restaurant_name, mode='rating', idx=None):
         </div>
         """, unsafe_allow_html=True)
 
-        # สร้างแผนที่และเพิ่ม Marker
-        m = folium.Map(location=[restaurant['lat'], restaurant['lng']], zoom_start=15)
-        iframe = folium.IFrame(popup_content, width=300, height=300)
-        folium.Marker(
-            location=[restaurant['lat'], restaurant['lng']],
-            popup=folium.Popup(iframe, show=True),
-            tooltip=restaurant['title']
-        ).add_to(m)
-        
-        # แสดงแผนที่
-        map_key = f"map_{restaurant_name}_{mode}_{idx}" if idx is not None else f"map_{restaurant_name}_{mode}"
-        st_folium(m, width=700, key=map_key)
+        # ร้านที่คล้ายกันจาก factor ของโมเดล คำนวณไว้แล้วตอน warm-up
+        # ขั้นให้คะแนนไม่รอโมเดล: ถ้ายังโหลดไม่เสร็จก็ข้ามไปก่อน
+        loaded = startup.get_item_neighbours() if mode == 'display' else startup.peek_item_neighbours()
+        if loaded is not None:
+            item_neighbours, title_by_placeid = loaded
+            similar_titles = [
+                title_by_placeid[place_id]
+                for place_id in item_neighbours.similar(restaurant['placeid'])
+                if place_id in title_by_placeid
+            ]
+            if similar_titles:
+                st.caption("Similar places: " + ", ".join(similar_titles))
 
     # ส่วนการให้คะแนน
     if mode == 'rating':
@@ -138,21 +105,21 @@ if 'restaurants_to_rate' not in st.session_state:
 if 'rating_completed' not in st.session_state:
     st.session_state.rating_completed = False
 if 'recommendations' not in st.session_state:
-    st.session_state.recommendations = pd.DataFrame()
+    st.session_state.recommendations = session_handles.empty_recommendations()
     
 # Check if we have filtered data from the Filter page
-if 'filtered_restaurant_ids' in st.session_state and st.session_state.filtered_restaurant_ids:
-    # Filter the data based on the IDs from the Filter page
-    filtered_ids = st.session_state.filtered_restaurant_ids
-    filtered_data = data[data['placeid'].isin(filtered_ids)]
+if st.session_state.get('filtered_restaurant_rows') is not None and len(st.session_state.filtered_restaurant_rows) > 0:
+    # Filter the data based on the rows from the Filter page
+    filtered_rows = st.session_state.filtered_restaurant_rows
+    filtered_data = session_handles.take_rows(data, filtered_rows)
     
     # Use filtered data instead of full data
-    st.info(f"Using {len(filtered_ids)} filtered restaurants based on your preferences.")
+    st.info(f"Using {len(filtered_rows)} filtered restaurants based on your preferences.")
     data_to_use = filtered_data
     
     # Option to clear filters
     if st.button("Clear Filters"):
-        st.session_state.filtered_restaurant_ids = None
+        st.session_state.filtered_restaurant_rows = None
         st.rerun()
 else:
     data_to_use = data
@@ -167,6 +134,7 @@ else:
     num_restaurants = st.sidebar.slider("Number of restaurants to rate:", min(3, length_data_to_use), min(10, length_data_to_use), 5)
     
 num_recommendations = st.sidebar.slider("Number of recommendations to show:", 1, 10, 5)
+content_weight = st.sidebar.slider("Content-based weight:", 0.0, 1.0, 0.0, 0.1)
 
 
 # Initialize restaurants to rate if empty
@@ -182,6 +150,7 @@ if len(st.session_state.restaurants_to_rate) == 0 and not st.session_state.ratin
     
     # เก็บเฉพาะชื่อร้าน
     st.session_state.restaurants_to_rate = sampled['title'].tolist()
+    prefetch_thumbnails(sampled)
     
     # อัปเดตจำนวนร้านที่ให้คะแนนจริงๆ ในกรณีที่มีน้อยกว่าที่กำหนด
     if sample_count < num_restaurants:
@@ -201,6 +170,10 @@ if not st.session_state.rating_completed:
         if 'temp_ratings' not in st.session_state:
             st.session_state.temp_ratings = {}
             
+        # แผนที่เดียวสำหรับร้านที่ต้องให้คะแนนทั้งหมด แทนแผนที่แยกในแต่ละร้าน
+        to_rate = data[data['title'].isin(st.session_state.restaurants_to_rate)].drop_duplicates(subset=['title'])
+        streamlit_folium.st_folium(result_map.build_cluster_map(to_rate, image_url=thumbnail_cache.static_url), width=700, returned_objects=[], key="rating_map")
+            
         # ใช้ Accordion แทน Tabs
         for i, restaurant_name in enumerate(st.session_state.restaurants_to_rate):
             with st.expander(f"Restaurant #{i+1}: {restaurant_name}", expanded=(i == 0)):
@@ -240,9 +213,9 @@ if not st.session_state.rating_completed:
 
 
 # Recommendation Phase
-if st.session_state.rating_completed and st.session_state.recommendations.empty:
+if st.session_state.rating_completed and session_handles.is_empty(st.session_state.recommendations):
     with st.spinner('Wait for it...'):
-        time.sleep(5)
+        predictions, algo = startup.get_model()
         st.success("Done!")
     st.subheader("Your Ratings Summary")
     ratings_df = pd.DataFrame(
@@ -257,42 +230,65 @@ if st.session_state.rating_completed and st.session_state.recommendations.empty:
         place_id = data[data['title'] == restaurant]['placeid'].iloc[0]
         new_user_ratings.append(('new_user', place_id, float(rating)))
     
-    # Combine with existing ratings
-    df_combined = pd.concat([ratings_data, pd.DataFrame(new_user_ratings, columns=['reviewerid', 'placeid', 'reviewerrated'])]).reset_index(drop=True)
-    
-    # Train model with combined data
-    reader = Reader(rating_scale=(1, 5))
-    data_combined = Dataset.load_from_df(df_combined, reader)
-    trainset_combined = data_combined.build_full_trainset()
-    algo.fit(trainset_combined)
-    
     # Get unrated restaurants
     rated_place_ids = [data[data['title'] == rest]['placeid'].iloc[0] 
                       for rest in st.session_state.rated_restaurants.keys()]
     all_restaurants = data['placeid'].unique()
-    
-    # Generate predictions
-    predictions = []
-    for place_id in all_restaurants:
-        if place_id not in rated_place_ids:
+    unrated_restaurants = [place_id for place_id in all_restaurants if place_id not in rated_place_ids]
+
+    if startup.ONLINE_SVD:
+        # fold-in คะแนนของผู้ใช้ด้วย SGD ไม่กี่รอบบนสำเนาของโมเดล (ไม่ publish ให้ผู้ใช้อื่น) แทนการ fit ใหม่ทั้งชุดข้อมูล
+        model_version = startup.get_online_model().fold_in(new_user_ratings)
+        recommendations_df = pd.DataFrame({
+            'placeid': unrated_restaurants,
+            'predicted_rating': model_version.predict_many('new_user', unrated_restaurants),
+        })
+    else:
+        # Combine with existing ratings
+        df_combined = pd.concat([ratings_data, pd.DataFrame(new_user_ratings, columns=['reviewerid', 'placeid', 'reviewerrated'])]).reset_index(drop=True)
+        
+        # Train model with combined data
+        reader = surprise.Reader(rating_scale=(1, 5))
+        data_combined = surprise.Dataset.load_from_df(df_combined, reader)
+        trainset_combined = data_combined.build_full_trainset()
+        algo.fit(trainset_combined)
+        
+        # Generate predictions
+        predictions = []
+        for place_id in unrated_restaurants:
             pred = algo.predict('new_user', place_id)
             predictions.append({
                 'placeid': pred.iid,
                 'predicted_rating': pred.est
             })
+        
+        # Create recommendations dataframe
+        recommendations_df = pd.DataFrame(predictions)
     
-    # Create recommendations dataframe
-    recommendations_df = pd.DataFrame(predictions)
-    st.session_state.recommendations = (
+    # ผสมคะแนนจาก content-based กับ SVD (hybrid)
+    if content_weight > 0:
+        rated_by_placeid = {
+            data[data['title'] == rest]['placeid'].iloc[0]: rate
+            for rest, rate in st.session_state.rated_restaurants.items()
+        }
+        # ร้านที่ไม่มีร้านคล้ายกันในที่ให้คะแนนไว้ ใช้คะแนนจาก SVD ตามเดิม
+        content_estimates = content_engine.estimate(
+            rated_by_placeid, recommendations_df['placeid'], fallback=recommendations_df['predicted_rating']
+        )
+        recommendations_df['predicted_rating'] = content_similarity.blend(
+            recommendations_df['predicted_rating'], content_estimates, content_weight
+        )
+
+    # เก็บเฉพาะตำแหน่งแถวและคะแนน ไม่เก็บ DataFrame ที่ merge แล้ว
+    st.session_state.recommendations = session_handles.recommendation_handle(
+        data,
         recommendations_df
         .sort_values('predicted_rating', ascending=False)
         .head(num_recommendations)
-        .merge(data, on='placeid')
-        .sort_values('predicted_rating', ascending=False).drop_duplicates(subset=['title'])
-    )   
+    )
 
 # Display recommendations (show all at once instead of tabs)
-if not st.session_state.recommendations.empty:
+if not session_handles.is_empty(st.session_state.recommendations):
     st.write("Your Ratings Summary")
     df_rated_restaurants = pd.DataFrame(
         [(rest, rate) for rest, rate in st.session_state.rated_restaurants.items()],
@@ -300,9 +296,13 @@ if not st.session_state.recommendations.empty:
     )
     st.dataframe(df_rated_restaurants)
     st.subheader("Top Restaurant Recommendations")
+    recommendations = session_handles.materialize_recommendations(data, st.session_state.recommendations)
+
+    # แผนที่เดียวสำหรับร้านที่แนะนำทั้งหมด
+    streamlit_folium.st_folium(result_map.build_cluster_map(recommendations, image_url=thumbnail_cache.static_url), width=700, returned_objects=[], key="recommendations_map")
 
     # Display all top 5 recommendations together
-    for i, (_, row) in enumerate(st.session_state.recommendations.iterrows()):
+    for i, (_, row) in enumerate(recommendations.iterrows()):
         # st.markdown(f"### {i+1}. {row['title']}")
         with st.expander(f"Restaurant #{i+1}: {row['title']}"):
             get_user_rating(row['title'], mode='display', idx=i)
@@ -318,6 +318,6 @@ if st.sidebar.button("Start Over"):
     st.session_state.rated_restaurants = {}
     st.session_state.restaurants_to_rate = []
     st.session_state.rating_completed = False
-    st.session_state.recommendations = pd.DataFrame()
+    st.session_state.recommendations = session_handles.empty_recommendations()
     st.session_state.temp_ratings = {}
     st.rerun()
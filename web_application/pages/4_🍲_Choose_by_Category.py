@@ -1,20 +1,19 @@
 import streamlit as st
-import pandas as pd
-import folium
-from surprise import SVD, dump, Dataset, Reader
 from collections import defaultdict
-from streamlit_folium import st_folium
-import time
-from supabase import create_client, Client
+import startup
 
-# อ่านไฟล์ secret.toml
-#secret_data = toml.load(".\secrets.toml")
+# import โมดูลที่ใช้เวลานานเมื่อถูกใช้งานจริงเท่านั้น
+pd = startup.lazy_import("pandas")
+surprise = startup.lazy_import("surprise")
+streamlit_folium = startup.lazy_import("streamlit_folium")
+result_map = startup.lazy_import("result_map")
+content_similarity = startup.lazy_import("content_similarity")
+session_handles = startup.lazy_import("session_handles")
+thumbnails = startup.lazy_import("thumbnails")
+category_index_module = startup.lazy_import("category_index")
 
-# ดึง API key จากไฟล์ secret.toml
-supabase_url = st.secrets["SUPABASE_URL"]
-supabase_key = st.secrets["SUPABASE_KEY"]
-
-supabase: Client = create_client(supabase_url, supabase_key)
+# ดึง API key จากไฟล์ secret.toml แล้วเริ่มโหลดข้อมูลและโมเดลใน background
+startup.start(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
 
 # Page setup
 st.set_page_config(
@@ -25,63 +24,36 @@ st.set_page_config(
 st.title("🍲 Choose Restaurants by Category")
 st.sidebar.success("Choose restaurants from your favorite categories")
 
-@st.cache_data
-def load_data_from_db():
-    response_restaurants = (supabase.table("restaurants").select("*").execute())    
-    data = pd.DataFrame(response_restaurants.data)
-    response_ratings = (supabase.table("reviews").select("*").execute())
-    ratings_data = pd.DataFrame(response_ratings.data)
-    ratings_data = ratings_data[['reviewerid', 'placeid', 'reviewerrated']]
-    return data, ratings_data
+# ขั้นเลือกและให้คะแนนใช้แค่ข้อมูลร้าน ส่วนโมเดลจะรอเมื่อถึงขั้นแนะนำเท่านั้น
+with st.spinner("Loading restaurant data..."):
+    data, ratings_data = startup.get_data()
 
+# _data ไม่ถูก hash ทุก rerun (startup คืน DataFrame ตัวเดิมตลอดอายุ process)
 @st.cache_resource
-def load_model_from_db():
-    bucket_name = "dumpmodel"
-    destination_path = ".\dump_model\dump_SVD_file.pkl"
-    with open(destination_path, "wb") as f:
-        response = (
-            supabase.storage
-            .from_(bucket_name)
-            .download("dump_model/dump_SVD_file.pkl")
-        )
-        f.write(response)
-    predictions, algo = dump.load(destination_path)
-    return predictions, algo
+def load_content_engine(_data):
+    return content_similarity.ContentSimilarity.from_frame(_data)
+
+content_engine = load_content_engine(data)
+
+# จัดกลุ่มร้านตามหมวดหมู่ครั้งเดียวต่อชุดข้อมูล
+@st.cache_resource
+def load_category_index(_data):
+    return category_index_module.CategoryIndex(_data)
+
+category_index = load_category_index(data)
 
-data, ratings_data = load_data_from_db()
-predictions, algo = load_model_from_db()
+# thumbnail ของรูปร้านเก็บไว้ในเครื่อง แล้วค่อยๆ ดึงล่วงหน้าสำหรับร้านที่กำลังจะแสดง
+thumbnail_cache = thumbnails.default_cache()
+
+def prefetch_thumbnails(frame):
+    if 'imageurls' in frame.columns:
+        thumbnail_cache.prefetch(result_map.first_image_url(value) for value in frame['imageurls'])
 
 # Utility function for displaying restaurant info
 def get_user_rating(restaurant_name, mode='rating', idx=None):
     restaurant = data[data['title'] == restaurant_name].iloc[0]
     
-    # ดึง URL รูปภาพแรก (ถ้ามี)
-    image_url = None
-    if 'imageurls' in restaurant and pd.notna(restaurant['imageurls']):
-        if isinstance(restaurant['imageurls'], str):
-            try:
-                image_list = eval(restaurant['imageurls'])
-            except:
-                image_list = []
-        else:
-            image_list = restaurant['imageurls']
-        
-        if len(image_list) > 0:
-            image_url = image_list[0]
-
-    # สร้าง HTML สำหรับ Popup
-    popup_content = f"""
-    <div style="max-width: 300px; word-wrap: break-word;">
-        <h4 style="margin-bottom: 5px; font-size: 16px; text-align: left;">{restaurant['title']}</h4>
-        <p><a href='{restaurant['url']}' target='_blank'>View on Google Map</a></p>
-    """
-    if image_url:
-        popup_content += f"<img src='{image_url}' style='width:300px;'>"
-    else:
-        popup_content += "<p>No image available</p>"       
-    
-
-    with st.container(border=True, height=700):
+    with st.container(border=True):
         # แสดงข้อมูลร้านอาหารในคอลัมน์เดียว
         st.markdown(f"""
         <div class="restaurant-card">
@@ -93,18 +65,18 @@ def get_user_rating(restaurant_name, mode='rating', idx=None):
         </div>
         """, unsafe_allow_html=True)
 
-        # สร้างแผนที่และเพิ่ม Marker
-        m = folium.Map(location=[restaurant['lat'], restaurant['lng']], zoom_start=15)
-        iframe = folium.IFrame(popup_content, width=300, height=300)
-        folium.Marker(
-            location=[restaurant['lat'], restaurant['lng']],
-            popup=folium.Popup(iframe, show=True),
-            tooltip=restaurant['title']
-        ).add_to(m)
-        
-        # แสดงแผนที่
-        map_key = f"map_{restaurant_name}_{mode}_{idx}" if idx is not None else f"map_{restaurant_name}_{mode}"
-        st_folium(m, width=700, key=map_key)
+        # ร้านที่คล้ายกันจาก factor ของโมเดล คำนวณไว้แล้วตอน warm-up
+        # ขั้นให้คะแนนไม่รอโมเดล: ถ้ายังโหลดไม่เสร็จก็ข้ามไปก่อน
+        loaded = startup.get_item_neighbours() if mode == 'display' else startup.peek_item_neighbours()
+        if loaded is not None:
+            item_neighbours, title_by_placeid = loaded
+            similar_titles = [
+                title_by_placeid[place_id]
+                for place_id in item_neighbours.similar(restaurant['placeid'])
+                if place_id in title_by_placeid
+            ]
+            if similar_titles:
+                st.caption("Similar places: " + ", ".join(similar_titles))
 
     # ส่วนการให้คะแนน
     if mode == 'rating':
@@ -129,7 +101,7 @@ if 'ratings_by_category' not in st.session_state:
 if 'rating_completed_category' not in st.session_state:
     st.session_state.rating_completed_category = False
 if 'recommendations_by_category' not in st.session_state:
-    st.session_state.recommendations_by_category = pd.DataFrame()
+    st.session_state.recommendations_by_category = session_handles.empty_recommendations()
 if 'temp_ratings_by_category' not in st.session_state:
     st.session_state.temp_ratings_by_category = {}
 
@@ -137,12 +109,8 @@ if 'temp_ratings_by_category' not in st.session_state:
 if not st.session_state.rating_completed_category and not st.session_state.selected_restaurants:
     st.subheader("Step 1: Select Restaurant Categories")
     
-    # Get unique categories
-    categories = data['categoryname'].dropna().unique()
-    categories = sorted([cat for cat in categories if pd.notna(cat) and cat.strip() != ''])
-    
     # Add 'All Categories' option
-    categories = ['All Categories'] + list(categories)
+    categories = ['All Categories'] + category_index.categories
     
     # Allow multiple category selection
     selected_categories = st.multiselect(
@@ -151,27 +119,17 @@ if not st.session_state.rating_completed_category and not st.session_state.selec
         default=['All Categories']
     )
     
-    # Filter restaurants based on selected categories
-    filtered_data = data.copy()
-    if selected_categories and 'All Categories' not in selected_categories:
-        filtered_data = data[data['categoryname'].isin(selected_categories)]
-    
-    # Group restaurants by category for display
-    category_restaurant_dict = {}
-    
+    # Group restaurants by category for display (เก็บแค่จำนวนร้านต่อหมวด)
     if 'All Categories' in selected_categories:
         # If 'All Categories' selected, include all categories
-        for category in categories:
-            if category != 'All Categories':
-                category_restaurants = filtered_data[filtered_data['categoryname'] == category]['title'].unique()
-                if len(category_restaurants) > 0:
-                    category_restaurant_dict[category] = category_restaurants
+        category_restaurant_dict = dict(category_index.counts)
     else:
         # Only include selected categories
-        for category in selected_categories:
-            category_restaurants = filtered_data[filtered_data['categoryname'] == category]['title'].unique()
-            if len(category_restaurants) > 0:
-                category_restaurant_dict[category] = category_restaurants
+        category_restaurant_dict = {
+            category: category_index.counts[category]
+            for category in selected_categories
+            if category in category_index.counts
+        }
     
     # Store the filtered data for the next step
     st.session_state.category_restaurant_dict = category_restaurant_dict  
@@ -193,7 +151,7 @@ if not st.session_state.rating_completed_category and len(st.session_state.selec
     # Check if 'All Categories' is selected
     if 'All Categories' in selected_categories:
         # Show all restaurants from all categories without dropdown selection
-        all_restaurants = data['title'].unique()
+        all_restaurants = category_index.all_titles
         selected = st.multiselect(
             "Select restaurants from all categories:",
             all_restaurants,
@@ -203,15 +161,7 @@ if not st.session_state.rating_completed_category and len(st.session_state.selec
 
     else:
     # If specific categories are selected, combine restaurants from the selected categories
-        combined_restaurants = []
-        
-        for category in selected_categories:
-            # Get restaurants from each selected category
-            category_restaurants = data[data['categoryname'] == category]['title'].unique()
-            combined_restaurants.extend(category_restaurants)  # Combine them into one list
-        
-        # Remove duplicates (if any) after combining
-        combined_restaurants = list(set(combined_restaurants))
+        combined_restaurants = category_index.titles_for(selected_categories)
         
         # Show the combined list of restaurants in one dropdown
         selected = st.multiselect(
@@ -224,6 +174,8 @@ if not st.session_state.rating_completed_category and len(st.session_state.selec
     # Show number of recommendations
     num_recommendations = st.slider("Number of recommendations to show:", 1, 10, 5)
     st.session_state.num_recommendations_category = num_recommendations
+    content_weight = st.slider("Content-based weight:", 0.0, 1.0, 0.0, 0.1)
+    st.session_state.content_weight_category = content_weight
     
     # Button to proceed to the next step
     if st.button("Next: Rate Selected Restaurants", type="primary"):
@@ -231,6 +183,7 @@ if not st.session_state.rating_completed_category and len(st.session_state.selec
             st.warning("Please select at least one restaurant.")
         else:
             st.session_state.selected_restaurants = all_selected_restaurants  # Update session state
+            prefetch_thumbnails(data[data['title'].isin(all_selected_restaurants)].drop_duplicates(subset=['title']))
             st.rerun()
 
 # Step 3: Rate selected restaurants
@@ -240,6 +193,10 @@ if not st.session_state.rating_completed_category and st.session_state.selected_
     # แสดงจำนวนร้านที่ต้องให้คะแนน
     st.info(f"You need to rate {len(st.session_state.selected_restaurants)} selected restaurants.")
     
+    # แผนที่เดียวสำหรับร้านที่ต้องให้คะแนนทั้งหมด แทนแผนที่แยกในแต่ละร้าน
+    to_rate = data[data['title'].isin(st.session_state.selected_restaurants)].drop_duplicates(subset=['title'])
+    streamlit_folium.st_folium(result_map.build_cluster_map(to_rate, image_url=thumbnail_cache.static_url), width=700, returned_objects=[], key="rating_map")
+    
     # ใช้ Accordion เพื่อแสดงร้านอาหารแต่ละร้าน
     for i, restaurant_name in enumerate(st.session_state.selected_restaurants):
         with st.expander(f"Restaurant #{i+1}: {restaurant_name}", expanded=(i == 0)):
@@ -269,11 +226,11 @@ if not st.session_state.rating_completed_category and st.session_state.selected_
             st.rerun()
 
 # Step 4: Generate recommendations based on ratings
-if st.session_state.rating_completed_category and st.session_state.recommendations_by_category.empty:
+if st.session_state.rating_completed_category and session_handles.is_empty(st.session_state.recommendations_by_category):
     st.subheader("Step 4: Generating Recommendations")
     
     with st.spinner('Generating restaurant recommendations...'):
-        time.sleep(3)
+        predictions, algo = startup.get_model()
         
         # Create new user ratings dataset
         new_user_ratings = []
@@ -281,46 +238,68 @@ if st.session_state.rating_completed_category and st.session_state.recommendatio
             place_id = data[data['title'] == restaurant]['placeid'].iloc[0]
             new_user_ratings.append(('new_user', place_id, float(rating)))
         
-        # Combine with existing ratings
-        df_combined = pd.concat([ratings_data, pd.DataFrame(new_user_ratings, columns=['reviewerid', 'placeid', 'reviewerrated'])]).reset_index(drop=True)
-        
-        # Train model with combined data
-        reader = Reader(rating_scale=(1, 5))
-        data_combined = Dataset.load_from_df(df_combined, reader)
-        trainset_combined = data_combined.build_full_trainset()
-        algo.fit(trainset_combined)
-        
         # Get unrated restaurants
         rated_place_ids = [data[data['title'] == rest]['placeid'].iloc[0] 
                           for rest in st.session_state.ratings_by_category.keys()]
         all_restaurants = data['placeid'].unique()
-        
-        # Generate predictions
-        predictions = []
-        for place_id in all_restaurants:
-            if place_id not in rated_place_ids:
+        unrated_restaurants = [place_id for place_id in all_restaurants if place_id not in rated_place_ids]
+
+        if startup.ONLINE_SVD:
+            # fold-in คะแนนของผู้ใช้ด้วย SGD ไม่กี่รอบบนสำเนาของโมเดล (ไม่ publish ให้ผู้ใช้อื่น) แทนการ fit ใหม่ทั้งชุดข้อมูล
+            model_version = startup.get_online_model().fold_in(new_user_ratings)
+            recommendations_df = pd.DataFrame({
+                'placeid': unrated_restaurants,
+                'predicted_rating': model_version.predict_many('new_user', unrated_restaurants),
+            })
+        else:
+            # Combine with existing ratings
+            df_combined = pd.concat([ratings_data, pd.DataFrame(new_user_ratings, columns=['reviewerid', 'placeid', 'reviewerrated'])]).reset_index(drop=True)
+            
+            # Train model with combined data
+            reader = surprise.Reader(rating_scale=(1, 5))
+            data_combined = surprise.Dataset.load_from_df(df_combined, reader)
+            trainset_combined = data_combined.build_full_trainset()
+            algo.fit(trainset_combined)
+            
+            # Generate predictions
+            predictions = []
+            for place_id in unrated_restaurants:
                 pred = algo.predict('new_user', place_id)
                 predictions.append({
                     'placeid': pred.iid,
                     'predicted_rating': pred.est
                 })
+            
+            # Create recommendations dataframe
+            recommendations_df = pd.DataFrame(predictions)
         
-        # Create recommendations dataframe
-        recommendations_df = pd.DataFrame(predictions)
-        st.session_state.recommendations_by_category = (
+        # ผสมคะแนนจาก content-based กับ SVD (hybrid)
+        if st.session_state.content_weight_category > 0:
+            rated_by_placeid = {
+                data[data['title'] == rest]['placeid'].iloc[0]: rate
+                for rest, rate in st.session_state.ratings_by_category.items()
+            }
+            # ร้านที่ไม่มีร้านคล้ายกันในที่ให้คะแนนไว้ ใช้คะแนนจาก SVD ตามเดิม
+            content_estimates = content_engine.estimate(
+                rated_by_placeid, recommendations_df['placeid'], fallback=recommendations_df['predicted_rating']
+            )
+            recommendations_df['predicted_rating'] = content_similarity.blend(
+                recommendations_df['predicted_rating'], content_estimates, st.session_state.content_weight_category
+            )
+
+        # เก็บเฉพาะตำแหน่งแถวและคะแนน ไม่เก็บ DataFrame ที่ merge แล้ว
+        st.session_state.recommendations_by_category = session_handles.recommendation_handle(
+            data,
             recommendations_df
             .sort_values('predicted_rating', ascending=False)
             .head(st.session_state.num_recommendations_category)
-            .merge(data, on='placeid')
-            .sort_values('predicted_rating', ascending=False)
-            .drop_duplicates(subset=['title'])
         )
         
         st.success("Recommendations generated successfully!")
         st.rerun()
 
 # Step 5: Display recommendations with Accordion
-if st.session_state.rating_completed_category and not st.session_state.recommendations_by_category.empty:
+if st.session_state.rating_completed_category and not session_handles.is_empty(st.session_state.recommendations_by_category):
     st.write("Your Ratings Summary")
     df_rated_restaurants = pd.DataFrame(
         [(rest, rate) for rest, rate in st.session_state.ratings_by_category.items()],
@@ -328,9 +307,13 @@ if st.session_state.rating_completed_category and not st.session_state.recommend
     )
     st.dataframe(df_rated_restaurants)
     st.subheader("Top Restaurant Recommendations")
+    recommendations = session_handles.materialize_recommendations(data, st.session_state.recommendations_by_category)
+
+    # แผนที่เดียวสำหรับร้านที่แนะนำทั้งหมด
+    streamlit_folium.st_folium(result_map.build_cluster_map(recommendations, image_url=thumbnail_cache.static_url), width=700, returned_objects=[], key="recommendations_map")
 
     # Display all top 5 recommendations in Accordion style
-    for i, (_, row) in enumerate(st.session_state.recommendations_by_category.iterrows()):
+    for i, (_, row) in enumerate(recommendations.iterrows()):
         with st.expander(f"Restaurant #{i+1}: {row['title']}"):  # Set the first expander to expanded
             get_user_rating(row['title'], mode='display', idx=i)
             st.markdown(f"""
@@ -348,7 +331,7 @@ if st.sidebar.button("Start Over"):
     st.session_state.selected_restaurants = []
     st.session_state.ratings_by_category = {}
     st.session_state.rating_completed_category = False
-    st.session_state.recommendations_by_category = pd.DataFrame()
+    st.session_state.recommendations_by_category = session_handles.empty_recommendations()
     st.session_state.temp_ratings_by_category = {}
     if hasattr(st.session_state, 'category_selection_done'):
         delattr(st.session_state, 'category_selection_done')
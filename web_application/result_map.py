@@ -0,0 +1,86 @@
+import ast
+
+import folium
+from folium.plugins import FastMarkerCluster
+import pandas as pd
+
+# Popup ถูกสร้างฝั่ง browser เมื่อผู้ใช้คลิก marker เท่านั้น
+# แต่ละแถวของข้อมูลคือ [lat, lng, title, url, image_url]
+CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindTooltip(row[2]);
+    marker.bindPopup(function () {
+        var box = document.createElement('div');
+        box.style.maxWidth = '300px';
+        box.style.wordWrap = 'break-word';
+        var title = document.createElement('h4');
+        title.style.marginBottom = '5px';
+        title.textContent = row[2];
+        box.appendChild(title);
+        if (row[3]) {
+            var link = document.createElement('a');
+            link.href = row[3];
+            link.target = '_blank';
+            link.textContent = 'View on Google Map';
+            box.appendChild(link);
+        }
+        if (row[4]) {
+            var image = document.createElement('img');
+            image.src = row[4];
+            image.loading = 'lazy';
+            image.style.width = '300px';
+            box.appendChild(image);
+        }
+        return box;
+    }, {maxWidth: 320});
+    return marker;
+}
+"""
+
+
+def first_image_url(imageurls):
+    if isinstance(imageurls, str):
+        try:
+            imageurls = ast.literal_eval(imageurls)
+        except (ValueError, SyntaxError):
+            return None
+    if isinstance(imageurls, (list, tuple)) and len(imageurls) > 0:
+        return imageurls[0]
+    return None
+
+
+def marker_rows(frame, image_url=None, remote_fallback=True):
+    """Marker rows for ``frame``; ``image_url`` may map a remote image URL to a local one.
+
+    With ``remote_fallback=False`` an image that ``image_url`` cannot map is left
+    out instead of linking the full-size remote image.
+    """
+    frame = frame.drop_duplicates(subset=['placeid']).dropna(subset=['lat', 'lng'])
+    urls = frame['url'] if 'url' in frame.columns else pd.Series(None, index=frame.index)
+    images = frame['imageurls'] if 'imageurls' in frame.columns else pd.Series(None, index=frame.index)
+    rows = []
+    for lat, lng, title, url, image in zip(frame['lat'], frame['lng'], frame['title'], urls, images):
+        image = first_image_url(image)
+        if image and image_url is not None:
+            image = image_url(image) or (image if remote_fallback else None)
+        rows.append([float(lat), float(lng), str(title), url if isinstance(url, str) else None, image])
+    return rows
+
+
+def build_cluster_map(frame, zoom_start=12, image_url=None, remote_fallback=True):
+    """One folium map with client-side clustering for a whole result set."""
+    rows = marker_rows(frame, image_url, remote_fallback)
+    if rows:
+        center = [sum(r[0] for r in rows) / len(rows), sum(r[1] for r in rows) / len(rows)]
+    else:
+        center = [13.7563, 100.5018]
+    m = folium.Map(location=center, zoom_start=zoom_start)
+    if rows:
+        FastMarkerCluster(rows, callback=CLUSTER_CALLBACK).add_to(m)
+        if len(rows) > 1:
+            m.fit_bounds([
+                [min(r[0] for r in rows), min(r[1] for r in rows)],
+                [max(r[0] for r in rows), max(r[1] for r in rows)],
+            ])
+    return m
@@ -0,0 +1,14 @@
+import os
+import sys
+
+import streamlit as st
+from streamlit.web import cli as stcli
+
+import startup
+
+# เริ่มโหลดข้อมูลและโมเดลทันทีที่ process เริ่ม ไม่ต้องรอผู้ใช้คนแรก
+if __name__ == "__main__":
+    startup.start(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    homepage = os.path.join(os.path.dirname(os.path.abspath(__file__)), "1_🏠_Homepage.py")
+    sys.argv = ["streamlit", "run", homepage] + sys.argv[1:]
+    sys.exit(stcli.main())
@@ -0,0 +1,53 @@
+import numpy as np
+
+# session_state เก็บเฉพาะตำแหน่งแถว (int32) ที่ชี้เข้าไปใน data ที่ใช้ร่วมกันทั้ง process
+# แล้วค่อยสร้าง DataFrame ตอน render เท่านั้น
+
+
+def rows_from_mask(mask):
+    return np.flatnonzero(np.asarray(mask)).astype(np.int32)
+
+
+def unique_place_rows(data, rows=None):
+    """First row of each ``placeid`` among ``rows`` (all rows when ``None``)."""
+    placeids = data['placeid'].to_numpy()
+    if rows is None:
+        rows = np.arange(len(data), dtype=np.int32)
+    _, first = np.unique(placeids[rows], return_index=True)
+    return np.asarray(rows)[np.sort(first)].astype(np.int32)
+
+
+def take_rows(data, rows, columns=None):
+    view = data if rows is None else data.iloc[rows]
+    return view if columns is None else view[columns]
+
+
+def empty_recommendations():
+    return {'rows': np.empty(0, dtype=np.int32), 'scores': np.empty(0, dtype=np.float32)}
+
+
+def is_empty(handle):
+    return handle is None or len(handle['rows']) == 0
+
+
+def recommendation_handle(data, recommendations_df):
+    """Compact handle for ranked ``placeid``/``predicted_rating`` rows.
+
+    Keeps the first catalog row of each place and one entry per title, in the
+    order of ``predicted_rating``.
+    """
+    catalog = data[['placeid', 'title']].assign(_row=np.arange(len(data), dtype=np.int32))
+    top = (
+        recommendations_df[['placeid', 'predicted_rating']]
+        .merge(catalog, on='placeid')
+        .sort_values('predicted_rating', ascending=False, kind='stable')
+        .drop_duplicates(subset=['title'])
+    )
+    return {
+        'rows': top['_row'].to_numpy(dtype=np.int32),
+        'scores': top['predicted_rating'].to_numpy(dtype=np.float32),
+    }
+
+
+def materialize_recommendations(data, handle):
+    return data.iloc[handle['rows']].assign(predicted_rating=handle['scores'])
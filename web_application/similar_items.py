@@ -0,0 +1,136 @@
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+_factors = None
+
+
+def _init_worker(factors):
+    global _factors
+    _factors = factors
+
+
+def _top_k_block(start, stop, k, block_size):
+    """Top-``k`` cosine neighbours for rows ``start:stop`` of the shared factors.
+
+    Columns are scanned in blocks so only ``(stop - start) x block_size``
+    similarities are held at a time.
+    """
+    rows = _factors[start:stop]
+    n_items = len(_factors)
+    best_idx = np.full((stop - start, k), -1, dtype=np.int32)
+    best_sim = np.full((stop - start, k), -np.inf, dtype=np.float32)
+    local = np.arange(stop - start)
+    for col_start in range(0, n_items, block_size):
+        col_stop = min(col_start + block_size, n_items)
+        sims = rows.dot(_factors[col_start:col_stop].T).astype(np.float32)
+        # ตัดตัวเองออกจากรายการ
+        own = (local + start >= col_start) & (local + start < col_stop)
+        sims[local[own], local[own] + start - col_start] = -np.inf
+        cols = np.broadcast_to(np.arange(col_start, col_stop, dtype=np.int32), sims.shape)
+        merged_sim = np.concatenate([best_sim, sims], axis=1)
+        merged_idx = np.concatenate([best_idx, cols], axis=1)
+        top = np.argpartition(-merged_sim, k - 1, axis=1)[:, :k]
+        best_sim = np.take_along_axis(merged_sim, top, axis=1)
+        best_idx = np.take_along_axis(merged_idx, top, axis=1)
+    order = np.argsort(-best_sim, axis=1, kind='stable')
+    return start, np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
+
+
+def compute_neighbours(qi, k=20, chunk_size=1024, block_size=4096, n_jobs=None):
+    """Top-``k`` cosine neighbours of every item factor row.
+
+    Returns ``(indices, similarities)`` as ``(n_items, k)`` int32 / float16
+    arrays, most similar first.
+    """
+    factors = np.asarray(qi, dtype=np.float32)
+    norms = np.linalg.norm(factors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    factors = factors / norms
+    n_items = len(factors)
+    k = min(k, max(n_items - 1, 0))
+    indices = np.empty((n_items, k), dtype=np.int32)
+    similarities = np.empty((n_items, k), dtype=np.float16)
+    if k == 0:
+        return indices, similarities
+
+    chunks = [(start, min(start + chunk_size, n_items)) for start in range(0, n_items, chunk_size)]
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(chunks) == 1:
+        _init_worker(factors)
+        results = (_top_k_block(start, stop, k, block_size) for start, stop in chunks)
+        for start, idx, sim in results:
+            indices[start:start + len(idx)] = idx
+            similarities[start:start + len(idx)] = sim
+        return indices, similarities
+
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(chunks)), initializer=_init_worker,
+                             initargs=(factors,)) as executor:
+        futures = [executor.submit(_top_k_block, start, stop, k, block_size) for start, stop in chunks]
+        for future in futures:
+            start, idx, sim = future.result()
+            indices[start:start + len(idx)] = idx
+            similarities[start:start + len(idx)] = sim
+    return indices, similarities
+
+
+def _raw_item_ids(algo):
+    trainset = algo.trainset
+    return [trainset.to_raw_iid(inner) for inner in range(trainset.n_items)]
+
+
+def model_fingerprint(algo):
+    """Hash of the item factors and ids, used to reject neighbours of another model."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(algo.qi, dtype=np.float64).tobytes())
+    digest.update("\n".join(map(str, _raw_item_ids(algo))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ItemNeighbours:
+    """Precomputed "similar places" lists keyed by ``placeid``."""
+
+    def __init__(self, placeids, indices, similarities, fingerprint=None):
+        self.placeids = np.asarray(placeids)
+        self.indices = indices
+        self.similarities = similarities
+        self.fingerprint = fingerprint
+        self.index = {placeid: row for row, placeid in enumerate(self.placeids.tolist())}
+
+    @classmethod
+    def from_algo(cls, algo, k=20, n_jobs=None):
+        indices, similarities = compute_neighbours(algo.qi, k=k, n_jobs=n_jobs)
+        return cls(_raw_item_ids(algo), indices, similarities, model_fingerprint(algo))
+
+    @classmethod
+    def load(cls, file):
+        """Load from a path or file object written by :meth:`save`."""
+        with np.load(file, allow_pickle=False) as stored:
+            fingerprint = str(stored['fingerprint']) if 'fingerprint' in stored.files else None
+            return cls(stored['placeids'], stored['indices'], stored['similarities'], fingerprint)
+
+    def save(self, file):
+        arrays = {}
+        if self.fingerprint is not None:
+            arrays['fingerprint'] = np.array(self.fingerprint)
+        np.savez_compressed(file, placeids=self.placeids.astype(str), indices=self.indices,
+                            similarities=self.similarities, **arrays)
+
+    def similar(self, placeid, n=5):
+        row = self.index.get(placeid)
+        if row is None:
+            return []
+        return self.placeids[self.indices[row, :n]].tolist()
+
+
+if __name__ == '__main__':
+    # python similar_items.py <dump_SVD_file.pkl> <output.npz> [k]
+    # อัปโหลดไฟล์ที่ได้ไปที่ dumpmodel/dump_model/item_neighbours.npz เพื่อให้ warm-up โหลดไปใช้
+    from surprise import dump
+
+    _, algo = dump.load(sys.argv[1])
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    ItemNeighbours.from_algo(algo, k=k).save(sys.argv[2])
@@ -0,0 +1,318 @@
+import importlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# โมดูลที่ import ช้า จะถูกโหลดใน background ก่อนที่หน้าเว็บจะต้องใช้
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'folium', 'streamlit_folium', 'surprise', 'supabase']
+
+MODEL_BUCKET = "dumpmodel"
+NEIGHBOURS_OBJECT = "dump_model/item_neighbours.npz"
+
+READY_FILE = os.environ.get("APP_READY_FILE", "/tmp/restaurant_app_ready")
+POPULARITY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "popular_restaurants.json")
+
+# ปิดด้วย ONLINE_SVD=0 เพื่อกลับไปใช้การ fit โมเดลใหม่ทั้งหมดในหน้าแนะนำ
+ONLINE_SVD = os.environ.get("ONLINE_SVD", "1") != "0"
+
+timings = {}
+
+# รอก่อนลองโหลดใหม่ (วินาที) เมื่อ Supabase มีปัญหา
+RETRY_BACKOFF = (5, 15, 60, 300)
+
+_lock = threading.Lock()
+_thread = None
+_credentials = None
+_data = Future()
+_model = Future()
+_neighbours = Future()
+_online = None
+
+
+class LazyModule:
+    """Module stand-in that only imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            already_loaded = self._name in sys.modules
+            self._module = importlib.import_module(self._name)
+            if not already_loaded:
+                timings.setdefault(f"import {self._name}", time.perf_counter() - started)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    # คืน LazyModule เสมอ: โมดูลใน sys.modules อาจยัง import ไม่เสร็จ (อีก thread กำลัง import อยู่)
+    # ส่วน importlib.import_module จะรอ import lock จนโมดูลพร้อม
+    return LazyModule(name)
+
+
+def _timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    timings[label] = time.perf_counter() - started
+    logger.info("%s took %.2fs", label, timings[label])
+    return result
+
+
+def load_data_from_db(supabase):
+    import pandas as pd
+
+    response_restaurants = (supabase.table("restaurants").select("*").execute())
+    data = pd.DataFrame(response_restaurants.data)
+    response_ratings = (supabase.table("reviews").select("*").execute())
+    ratings_data = pd.DataFrame(response_ratings.data)
+    ratings_data = ratings_data[['reviewerid', 'placeid', 'reviewerrated']]
+    return data, ratings_data
+
+
+def load_model_from_db(supabase):
+    from surprise import dump
+
+    bucket_name = MODEL_BUCKET
+    destination_path = r".\dump_model\dump_SVD_file.pkl"
+    with open(destination_path, "wb") as f:
+        response = (
+            supabase.storage
+            .from_(bucket_name)
+            .download("dump_model/dump_SVD_file.pkl")
+        )
+        f.write(response)
+    predictions, algo = dump.load(destination_path)
+    return predictions, algo
+
+
+def load_item_neighbours(supabase, algo):
+    import similar_items
+
+    # ใช้ไฟล์ที่เก็บไว้ข้างโมเดลใน bucket ถ้าคำนวณจากโมเดลตัวเดียวกัน
+    storage = supabase.storage.from_(MODEL_BUCKET)
+    fingerprint = similar_items.model_fingerprint(algo)
+    try:
+        neighbours = similar_items.ItemNeighbours.load(io.BytesIO(storage.download(NEIGHBOURS_OBJECT)))
+        if neighbours.fingerprint == fingerprint:
+            return neighbours
+        logger.warning("Stored item neighbours were built for another model, recomputing")
+    except Exception:
+        logger.warning("Could not download item neighbours, recomputing", exc_info=True)
+
+    # คำนวณใน warm-up thread แบบ process เดียว แล้วเก็บขึ้น bucket ไว้ใช้ครั้งถัดไป
+    neighbours = similar_items.ItemNeighbours.from_algo(algo, n_jobs=1)
+    try:
+        buffer = io.BytesIO()
+        neighbours.save(buffer)
+        storage.upload(NEIGHBOURS_OBJECT, buffer.getvalue(), {"upsert": "true"})
+    except Exception:
+        logger.warning("Could not upload item neighbours", exc_info=True)
+    return neighbours
+
+
+def compute_popularity(data, ratings_data, n=20, prior_weight=10):
+    # คะแนนเฉลี่ยแบบ Bayesian เพื่อไม่ให้ร้านที่มีรีวิวน้อยขึ้นอันดับต้นเกินจริง
+    stats = ratings_data.groupby('placeid')['reviewerrated'].agg(rating_mean='mean', reviews='count')
+    global_mean = ratings_data['reviewerrated'].mean()
+    stats['score'] = (
+        (stats['rating_mean'] * stats['reviews'] + global_mean * prior_weight)
+        / (stats['reviews'] + prior_weight)
+    )
+    top = (
+        stats.sort_values('score', ascending=False)
+        .head(n)
+        .join(data.drop_duplicates(subset=['placeid']).set_index('placeid')[['title', 'categoryname', 'totalscore']])
+        .reset_index()
+    )
+    return [
+        {
+            'placeid': row.placeid,
+            'title': row.title,
+            'categoryname': row.categoryname,
+            'totalscore': float(row.totalscore),
+            'reviews': int(row.reviews),
+        }
+        for row in top.itertuples()
+    ]
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _load_pending(supabase):
+    global _online
+    # โหลดเฉพาะส่วนที่ยังไม่สำเร็จ ส่วนที่โหลดได้แล้วจะไม่ถูกโหลดซ้ำ
+    if not _succeeded(_data):
+        data, ratings_data = _timed("load data", load_data_from_db, supabase)
+        _data.set_result((data, ratings_data))
+        _write_json(POPULARITY_FILE, compute_popularity(data, ratings_data))
+    if not _succeeded(_model):
+        predictions, algo = _timed("load model", load_model_from_db, supabase)
+        if ONLINE_SVD:
+            from online_svd import OnlineSVD
+
+            # fold-in ผู้ใช้ใหม่ด้วยจำนวนรอบเท่ากับตอน train โมเดล
+            _online = _timed("build online model", OnlineSVD, algo, algo.n_epochs)
+        _model.set_result((predictions, algo))
+    if not _succeeded(_neighbours):
+        data, _ = _data.result()
+        _, algo = _model.result()
+        neighbours = _timed("load item neighbours", load_item_neighbours, supabase, algo)
+        title_by_placeid = data.drop_duplicates(subset=['placeid']).set_index('placeid')['title'].to_dict()
+        _neighbours.set_result((neighbours, title_by_placeid))
+
+
+def _succeeded(future):
+    return future.done() and future.exception() is None
+
+
+def _fail_pending(error):
+    # ผู้ที่เรียก get_data()/get_model() ระหว่างรอ retry จะได้ error นี้ทันที เหมือน cache_data เดิม
+    with _lock:
+        for future in (_data, _model, _neighbours):
+            if not future.done():
+                future.set_exception(error)
+
+
+def _reset_failed():
+    # เตรียม Future ใหม่ให้ส่วนที่โหลดไม่สำเร็จ ก่อนลองโหลดรอบถัดไป
+    global _data, _model, _neighbours
+    with _lock:
+        if not _succeeded(_data):
+            _data = Future()
+        if not _succeeded(_model):
+            _model = Future()
+        if not _succeeded(_neighbours):
+            _neighbours = Future()
+
+
+def _warm_up(supabase_url, supabase_key):
+    started = time.perf_counter()
+    for name in HEAVY_MODULES:
+        try:
+            _timed(f"import {name}", importlib.import_module, name)
+        except ImportError:
+            logger.exception("Could not import %s during warm-up", name)
+
+    attempt = 0
+    while True:
+        try:
+            from supabase import create_client
+            supabase = _timed("create supabase client", create_client, supabase_url, supabase_key)
+            _load_pending(supabase)
+            break
+        except Exception as e:
+            delay = RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF) - 1)]
+            attempt += 1
+            logger.exception("Warm-up attempt %d failed, retrying in %ds", attempt, delay)
+            _fail_pending(e)
+            time.sleep(delay)
+            _reset_failed()
+
+    timings["warm-up total"] = time.perf_counter() - started
+    _write_json(READY_FILE, timings)
+    logger.info("Warm-up finished in %.2fs", timings["warm-up total"])
+
+
+def start(supabase_url, supabase_key):
+    """Start loading modules, data and model in the background.
+
+    Only one warm-up thread runs at a time; it keeps retrying with backoff
+    until data, model and item neighbours are loaded. Calling this again
+    after the thread has stopped (e.g. it was killed) starts a new one.
+    """
+    global _thread, _credentials
+    with _lock:
+        _credentials = (supabase_url, supabase_key)
+        if _thread is not None and (_thread.is_alive() or _succeeded(_neighbours)):
+            return
+        if _thread is None and os.path.exists(READY_FILE):
+            os.remove(READY_FILE)
+        _thread = threading.Thread(
+            target=_warm_up, args=(supabase_url, supabase_key), name="warm-up", daemon=True
+        )
+        _thread.start()
+
+
+def is_ready():
+    return _succeeded(_data) and _succeeded(_model)
+
+
+def _restart_if_stopped():
+    if _credentials is not None:
+        start(*_credentials)
+
+
+def get_data(timeout=None):
+    _restart_if_stopped()
+    return _data.result(timeout)
+
+
+def get_model(timeout=None):
+    _restart_if_stopped()
+    return _model.result(timeout)
+
+
+def get_online_model(timeout=None):
+    """Shared :class:`online_svd.OnlineSVD` serving the loaded model (visitors use ``fold_in``)."""
+    get_model(timeout)
+    return _online
+
+
+def get_item_neighbours(timeout=None):
+    """``(ItemNeighbours, title_by_placeid)`` for the loaded data and model."""
+    _restart_if_stopped()
+    return _neighbours.result(timeout)
+
+
+def peek_item_neighbours():
+    """Like :func:`get_item_neighbours` but returns ``None`` instead of waiting."""
+    _restart_if_stopped()
+    neighbours = _neighbours
+    return neighbours.result() if _succeeded(neighbours) else None
+
+
+def popular_restaurants():
+    """Popularity list from the last completed load, available before data is loaded."""
+    if os.path.exists(POPULARITY_FILE):
+        with open(POPULARITY_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    return []
+
+
+def build_popularity_file(supabase_url, supabase_key):
+    """Load the data once and write the popularity list (used at image build time)."""
+    from supabase import create_client
+
+    data, ratings_data = load_data_from_db(create_client(supabase_url, supabase_key))
+    popular = compute_popularity(data, ratings_data)
+    _write_json(POPULARITY_FILE, popular)
+    return popular
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--popularity"]:
+        # ใช้ตอน docker build เพื่อให้หน้าแรกมีรายการร้านยอดนิยมตั้งแต่ deploy ครั้งแรก
+        import streamlit as st
+
+        popular = build_popularity_file(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+        print(f"Wrote {len(popular)} restaurants to {POPULARITY_FILE}")
+        sys.exit(0)
+    # ใช้กับ HEALTHCHECK: exit 0 เมื่อโหลดข้อมูลและโมเดลเสร็จแล้ว
+    sys.exit(0 if os.path.exists(READY_FILE) else 1)
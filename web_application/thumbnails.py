@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ไฟล์ใน web_application/static จะถูกเสิร์ฟที่ /app/static เมื่อเปิด server.enableStaticServing
+THUMBNAIL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "thumbnails")
+THUMBNAIL_URL = "/app/static/thumbnails"
+
+
+def fetch_url(url, timeout=10, max_bytes=10 * 1024 * 1024):
+    request = urllib.request.Request(url, headers={"User-Agent": "restaurant-recommender"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image larger than {max_bytes} bytes: {url}")
+    return data
+
+
+def make_thumbnail(data, size=(300, 300), quality=80):
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        image.thumbnail(size)
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """Content-addressed on-disk cache of restaurant image thumbnails.
+
+    Thumbnails are stored under the SHA-256 of their bytes and looked up via
+    an index from source URL to file name. The index also keeps the size and
+    last access time of every file in LRU order with a running total, so when
+    the cache grows past ``max_bytes`` the oldest files are dropped without
+    scanning the directory.
+    """
+
+    def __init__(self, cache_dir=THUMBNAIL_DIR, max_bytes=200 * 1024 * 1024, size=(300, 300),
+                 fetch=fetch_url, max_workers=4, base_url=THUMBNAIL_URL, failure_ttl=300,
+                 save_interval=5):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.size = size
+        self.fetch = fetch
+        self.base_url = base_url
+        self.failure_ttl = failure_ttl
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._dirty = False
+        self._pending = {}
+        self._failed = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._urls, self._files = self._load_index()
+        self._total_bytes = sum(size for size, _ in self._files.values())
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        # index แบบเก่าเป็น {url: name} อย่างเดียว
+        urls = index.get("urls", {}) if "files" in index else index
+        known = index.get("files", {})
+        # อ่านรายชื่อไฟล์ครั้งเดียวตอนเริ่ม เพื่อรับไฟล์ที่ยังไม่ได้บันทึกลง index เข้ามาด้วย
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".jpg"):
+                continue
+            entry = known.get(name)
+            if entry is None:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entry = [stat.st_size, stat.st_mtime]
+            entries[name] = list(entry)
+        files = OrderedDict(sorted(entries.items(), key=lambda item: item[1][1]))
+        return {url: name for url, name in urls.items() if name in files}, files
+
+    def flush(self):
+        """Write the index to disk now instead of waiting for the scheduled save."""
+        with self._lock:
+            self._save_timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            urls = dict(self._urls)
+            files = {name: list(entry) for name, entry in self._files.items()}
+        payload = {"urls": {url: name for url, name in urls.items() if name in files}, "files": files}
+        with self._save_lock:
+            tmp_path = f"{self._index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self._index_path)
+
+    def _schedule_save(self):
+        # เรียกขณะถือ self._lock: รวมการเขียน index หลายครั้งเป็นครั้งเดียว
+        self._dirty = True
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_interval, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def cached_path(self, url):
+        with self._lock:
+            name = self._urls.get(url)
+            if name is None:
+                return None
+            entry = self._files.get(name)
+            if entry is None:
+                # ไฟล์ถูก evict ไปแล้ว
+                del self._urls[url]
+                return None
+            entry[1] = time.time()
+            self._files.move_to_end(name)
+            self._dirty = True
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, url):
+        """Local thumbnail path for ``url``, fetching and storing it if needed."""
+        path = self.cached_path(url)
+        if path is not None:
+            return path
+        thumbnail = make_thumbnail(self.fetch(url), self.size)
+        name = hashlib.sha256(thumbnail).hexdigest() + ".jpg"
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(thumbnail)
+        with self._lock:
+            # rename/unlink ใต้ lock เท่านั้น การเขียนไฟล์และ index ทำนอก lock
+            entry = self._files.get(name)
+            if entry is None:
+                os.replace(tmp_path, path)
+                self._files[name] = [len(thumbnail), time.time()]
+                self._total_bytes += len(thumbnail)
+            else:
+                os.remove(tmp_path)
+                entry[1] = time.time()
+                self._files.move_to_end(name)
+            self._urls[url] = name
+            self._evict()
+            self._schedule_save()
+        return path
+
+    def _evict(self):
+        # เรียกขณะถือ self._lock: ลบไฟล์ที่ไม่ได้ใช้นานที่สุดจนขนาดรวมไม่เกิน max_bytes
+        # (ไม่ลบไฟล์ล่าสุด แม้จะใหญ่กว่า max_bytes เอง)
+        while self._total_bytes > self.max_bytes and len(self._files) > 1:
+            name, (size, _) = self._files.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def _fetch_in_background(self, url):
+        path = None
+        try:
+            path = self.get(url)
+        except Exception:
+            logger.warning("Could not create thumbnail for %s", url, exc_info=True)
+        with self._lock:
+            self._pending.pop(url, None)
+            if path is None:
+                self._failed[url] = time.monotonic()
+            else:
+                self._failed.pop(url, None)
+        return path
+
+    def prefetch(self, urls):
+        """Queue thumbnails for ``urls`` on the bounded worker pool."""
+        futures = []
+        for url in urls:
+            if not url:
+                continue
+            with self._lock:
+                if self._urls.get(url) in self._files:
+                    continue
+                # URL ที่ดึงไม่สำเร็จจะลองใหม่ได้เมื่อพ้น failure_ttl
+                failed_at = self._failed.get(url)
+                if failed_at is not None and time.monotonic() - failed_at < self.failure_ttl:
+                    continue
+                future = self._pending.get(url)
+                if future is None:
+                    future = self._executor.submit(self._fetch_in_background, url)
+                    self._pending[url] = future
+            futures.append(future)
+        return futures
+
+    def cached_static_url(self, url):
+        """URL served by Streamlit for a cached thumbnail, or ``None``; never fetches."""
+        path = self.cached_path(url)
+        if path is None:
+            return None
+        return f"{self.base_url}/{os.path.basename(path)}"
+
+    def static_url(self, url):
+        """URL served by Streamlit for a cached thumbnail, or ``None`` (and queue it)."""
+        static_url = self.cached_static_url(url)
+        if static_url is None:
+            self.prefetch([url])
+        return static_url
+
+    def data_uri(self, url):
+        """Inline ``data:`` URI for a cached thumbnail, or ``None`` (and queue it)."""
+        path = self.cached_path(url)
+        if path is None:
+            self.prefetch([url])
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        return "data:image/jpeg;base64," + base64.b64encode(data).decode("ascii")
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Process-wide cache shared by all pages."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ThumbnailCache()
+        return _default_cache